@@ -0,0 +1,223 @@
+# Albumin Archives
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import posixpath
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from albumin.imdate import Report
+
+archive_suffixes = (
+    '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz',
+    '.zip',
+)
+
+
+def is_archive(path):
+    return bool(path) and os.path.isfile(path) \
+        and path.lower().endswith(archive_suffixes)
+
+
+def safe_name(name):
+    """
+    The member's name as a relative path, or None if it would end up
+    outside the folder it's extracted to.
+    """
+    name = posixpath.normpath(name.replace('\\', '/'))
+    if name.startswith(('/', '../')) or name in ('.', '..'):
+        return None
+    return name
+
+
+def archive_members(path):
+    """
+    Yields the name, size, modify time and a file object of each regular
+    file in the archive, in the order they are stored. Tar archives are
+    read as a stream, so each file object is only valid until the next
+    one is yielded.
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = safe_name(info.filename)
+                if info.is_dir() or name is None:
+                    continue
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                with archive.open(info) as file:
+                    yield name, info.file_size, mtime, file
+    else:
+        with tarfile.open(path, 'r|*') as archive:
+            for info in archive:
+                name = safe_name(info.name)
+                if not info.isfile() or name is None:
+                    continue
+                file = archive.extractfile(info)
+                yield name, info.size, info.mtime, file
+
+
+# Backends named differently than their hashlib hashes
+key_hashes = {
+    'BLAKE2B160': lambda: hashlib.blake2b(digest_size=20),
+    'BLAKE2B224': lambda: hashlib.blake2b(digest_size=28),
+    'BLAKE2B256': lambda: hashlib.blake2b(digest_size=32),
+    'BLAKE2B384': lambda: hashlib.blake2b(digest_size=48),
+    'BLAKE2B512': lambda: hashlib.blake2b(digest_size=64),
+    'BLAKE2S160': lambda: hashlib.blake2s(digest_size=20),
+    'BLAKE2S224': lambda: hashlib.blake2s(digest_size=28),
+    'BLAKE2S256': lambda: hashlib.blake2s(digest_size=32),
+}
+
+
+def key_hash(backend):
+    """
+    A new hash object for the git-annex backend, or None if its keys
+    can't be computed here (e.g. SKEIN256 or WORM), in which case git
+    annex calckey has to be run on the whole file.
+    """
+    name = backend[:-1] if backend.endswith('E') else backend
+    if name in key_hashes:
+        return key_hashes[name]()
+    try:
+        return hashlib.new(name.lower())
+    except ValueError:
+        return None
+
+
+def key_extension(name, max_length=4):
+    """
+    The extension git-annex puts at the end of *E backend keys: the last
+    two of the file's extensions, unless they are too long or odd.
+    """
+    def valid(ext):
+        return len(ext) <= max_length and all(
+            c == '-' or c.isalnum() and ord(c) < 128 for c in ext
+        )
+
+    parts = posixpath.basename(name).split('.')[1:]
+    exts = []
+    for ext in reversed(parts):
+        if len(ext) > max_length:
+            break
+        exts.append(ext)
+    exts = [ext for ext in exts if valid(ext)][:2]
+    exts = [ext for ext in reversed(exts) if ext]
+    return ''.join('.' + ext for ext in exts)
+
+
+def annex_key(backend, name, size, digest):
+    key = '{}-s{}--{}'.format(backend, size, digest)
+    if backend.endswith('E'):
+        key += key_extension(name)
+    return key
+
+
+def read_archive(path, backend=None, head_size=2**20, dest=None,
+                 skip=()):
+    """
+    Reads each file in the archive once, and yields its name, its annex
+    key (if a backend is given and key_hash can compute it), its first
+    head_size bytes and its modify time. With dest, also writes the file
+    under dest as it is read, with the same modify time. Files named in
+    skip are left out.
+    """
+    for name, size, mtime, file in archive_members(path):
+        if name in skip:
+            continue
+        hasher = key_hash(backend) if backend else None
+        out = None
+        if dest:
+            out_path = os.path.join(dest, name)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            out = open(out_path, 'wb')
+
+        head = b''
+        try:
+            while True:
+                if not (hasher or out) and len(head) >= head_size:
+                    break
+                data = file.read(2**20)
+                if not data:
+                    break
+                if len(head) < head_size:
+                    head += data[:head_size - len(head)]
+                if hasher:
+                    hasher.update(data)
+                if out:
+                    out.write(data)
+        finally:
+            if out:
+                out.close()
+                os.utime(out_path, (mtime, mtime))
+
+        key = annex_key(backend, name, size, hasher.hexdigest()) \
+            if hasher else None
+        yield name, key, head, mtime
+
+
+@contextmanager
+def archive_heads(path, backend=None, head_size=2**20):
+    """
+    Writes the first head_size bytes of each file in the archive into a
+    temporary folder, with its name and modify time, so they can be
+    analyzed like files on disk. Gives an OrderedDict of those paths to
+    their names in the archive and their keys.
+
+    If the backend's keys can't be computed here, whole files are
+    written instead and their keys are None, so that git annex calckey
+    can be run on them.
+    """
+    whole = bool(backend) and key_hash(backend) is None
+    temp_dir = tempfile.mkdtemp(prefix='albumin-')
+    try:
+        heads = OrderedDict()
+        for name, key, head, mtime in read_archive(
+            path, backend=backend, head_size=head_size,
+            dest=temp_dir if whole else None,
+        ):
+            head_path = os.path.join(temp_dir, name)
+            if not whole:
+                os.makedirs(os.path.dirname(head_path), exist_ok=True)
+                with open(head_path, 'wb') as file:
+                    file.write(head)
+                os.utime(head_path, (mtime, mtime))
+            heads[head_path] = (name, key)
+        yield heads
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def renamed_report(report, names):
+    """
+    The report, with its files renamed by the names dict.
+    """
+    files = OrderedDict(
+        (names[file], key) for file, key in report.files.items()
+    )
+    remaining = {names[file] for file in report.remaining}
+    updates = report.updates
+
+    if not report.has_keys:
+        files = list(files)
+        updates = {names[file]: new for file, (new, _) in updates.items()}
+
+    return Report(files, updates, remaining)
@@ -0,0 +1,350 @@
+# Albumin Batch Processes
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import asyncio
+import collections
+
+from albumin import diskorder
+
+
+class BatchProcess:
+    """
+    A long-running process that answers one response per request, in
+    the order the requests were written. Requests are pipelined: they
+    are written as soon as they are made, and a single reader task
+    matches responses to them as they arrive.
+
+    A request with a timeout kills the process if it answers nothing
+    for that long while the request waits, failing all its pending
+    requests with BrokenPipeError. The next request restarts it.
+    """
+
+    def __init__(self, *args, cwd=None):
+        self.args = args
+        self.cwd = cwd
+        self._process = None
+        self._started = None
+        self._reader = None
+        self._pending = collections.deque()
+        self._progress = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def start(self):
+        if self._process:
+            # The previous process stopped answering, reap it first.
+            await self._reap(self._process)
+        self._process = await asyncio.create_subprocess_exec(
+            *self.args, cwd=self.cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.ensure_future(self._read_responses())
+
+    async def request(self, request, timeout=None):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if not self._pending:
+            self._progress = loop.time()
+        self._pending.append(future)
+
+        if self._reader and self._reader.done() and self._started.done():
+            self._started = None
+        if not self._started:
+            self._started = asyncio.ensure_future(self.start())
+        await self._started
+
+        try:
+            self._process.stdin.write(self.encode(request))
+            await self._process.stdin.drain()
+        except ConnectionError:
+            pass
+
+        while True:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(future), timeout
+                )
+            except asyncio.TimeoutError:
+                if loop.time() - self._progress >= timeout:
+                    await self.kill()
+
+    async def kill(self):
+        process, reader = self._process, self._reader
+        self._process = None
+        self._reader = None
+        self._started = None
+        if reader:
+            reader.cancel()
+            await asyncio.wait([reader])
+        self._fail_pending()
+        if process:
+            await self._reap(process)
+
+    @staticmethod
+    async def _reap(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        process.stdin.close()
+        # wait() only returns after the output pipe is closed, so read
+        # what the process wrote before it was killed.
+        await process.stdout.read()
+        await process.wait()
+
+    async def close(self):
+        if not self._process:
+            return
+        self._process.stdin.close()
+        await self._reader
+        await self._process.wait()
+        self._process = None
+        self._started = None
+
+    async def _read_responses(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                response = await self.read_response()
+            except ValueError as err:
+                self._pending.popleft().set_exception(err)
+                continue
+            except asyncio.LimitOverrunError as err:
+                self._pending.popleft().set_exception(ValueError(err))
+                self._process.kill()
+                break
+            if response is None:
+                break
+            self._pending.popleft().set_result(response)
+            self._progress = loop.time()
+
+        self._fail_pending()
+
+    def _fail_pending(self):
+        while self._pending:
+            err = BrokenPipeError(' '.join(self.args))
+            self._pending.popleft().set_exception(err)
+
+    def encode(self, request):
+        return '{}\n'.format(request).encode()
+
+    async def read_response(self):
+        line = await self._process.stdout.readline()
+        if not line:
+            return None
+        return line.decode().rstrip('\n')
+
+    def __repr__(self):
+        return 'BatchProcess(args={!r})'.format(self.args)
+
+
+class AnnexBatch(BatchProcess):
+    def __init__(self, command, path):
+        super().__init__('git', 'annex', command, '--batch', cwd=path)
+
+
+class ExifToolBatch(BatchProcess):
+    sentinel = b'{ready}\n'
+
+    def __init__(self):
+        super().__init__(
+            'exiftool', '-stay_open', 'True', '-@', '-',
+            '-common_args', '-G', '-n',
+        )
+
+    def encode(self, args):
+        args = ['-j', *args, '-execute']
+        return ''.join('{}\n'.format(arg) for arg in args).encode()
+
+    async def read_response(self):
+        stdout = self._process.stdout
+        parts = []
+        while True:
+            try:
+                parts.append(await stdout.readuntil(self.sentinel))
+                break
+            except asyncio.LimitOverrunError as err:
+                parts.append(await stdout.readexactly(err.consumed))
+            except asyncio.IncompleteReadError:
+                return None
+        output = b''.join(parts)[:-len(self.sentinel)].decode()
+        return json.loads(output) if output.strip() else []
+
+    async def close(self):
+        if self._process:
+            self._process.stdin.write(b'-stay_open\nFalse\n')
+        await super().close()
+
+    def __repr__(self):
+        return 'ExifToolBatch()'
+
+
+class BatchPool:
+    """
+    Several batch processes of the same kind. Each request goes to the
+    process with the fewest pending requests. While warm pools are kept
+    (see keep_warm), opening a pool with the same key reuses it instead
+    of starting new processes.
+    """
+    warm = None
+
+    def __init__(self, factory, size=None):
+        self.processes = [factory() for _ in range(size or jobs())]
+        self.keep = False
+
+    @classmethod
+    def open(cls, key, factory, size=None):
+        if cls.warm is None:
+            return cls(factory, size)
+
+        if (key, size) not in cls.warm:
+            pool = cls(factory, size)
+            pool.keep = True
+            cls.warm[key, size] = pool
+        return cls.warm[key, size]
+
+    async def request(self, request, timeout=None):
+        process = min(self.processes, key=lambda p: p.pending)
+        return await process.request(request, timeout)
+
+    async def close(self):
+        await asyncio.gather(*(p.close() for p in self.processes))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if not self.keep:
+            await self.close()
+
+
+def jobs():
+    return os.cpu_count() or 1
+
+
+def chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+async def annex_batch(command, path, items, size=None, readahead=False):
+    """
+    Sends each item to a git-annex batch command and returns the
+    results by item. With readahead, the items are files that will be
+    read in full, and each is read ahead just before it is sent, with
+    at most two requests in flight per process.
+    """
+    items = list(items)
+    factory = lambda: AnnexBatch(command, path)
+
+    pool = BatchPool.open((command, path), factory, size)
+    in_flight = asyncio.Semaphore(2 * len(pool.processes))
+
+    async def request(item):
+        if not readahead:
+            return await pool.request(item)
+        async with in_flight:
+            diskorder.readahead([os.path.join(path, item)])
+            return await pool.request(item)
+
+    async with pool:
+        results = await asyncio.gather(*map(request, items))
+
+    return {item: result or None for item, result in zip(items, results)}
+
+
+async def exiftool_batch(paths, size=None, chunk_size=16, tags=None,
+                         reduce=None, timeout=60):
+    """
+    Reads the tags of the paths, or only the given tags if any, and
+    returns them by file. With reduce, each file's tags are replaced
+    with reduce(file, tags) as soon as they arrive, and dropped if that
+    is None, so only the reduced results are ever held together.
+
+    Each batch's files are read ahead as it is sent, up to their first
+    megabyte where exiftool usually finds the tags.
+
+    An exiftool process that crashes, hangs for timeout seconds or
+    prints garbage is restarted, and its batch is split in halves and
+    retried until the file causing it is alone. That file is left out
+    of the results, as if it had no tags.
+    """
+    pool = BatchPool.open('exiftool', ExifToolBatch, size)
+    tag_args = ['-{}'.format(tag) for tag in tags or []]
+    in_flight = asyncio.Semaphore(2 * len(pool.processes))
+    results = {}
+
+    async def request(chunk):
+        try:
+            async with in_flight:
+                diskorder.readahead(chunk, 2**20)
+                tags_list = await pool.request(
+                    [*tag_args, *chunk], timeout
+                )
+        except (BrokenPipeError, ValueError):
+            if len(chunk) > 1:
+                half = len(chunk) // 2
+                await asyncio.gather(
+                    request(chunk[:half]), request(chunk[half:])
+                )
+            return
+
+        for tags in tags_list:
+            file = tags.pop('SourceFile')
+            value = reduce(file, tags) if reduce else tags
+            if value is not None:
+                results[file] = value
+
+    async with pool:
+        await asyncio.gather(*map(request, chunks(paths, chunk_size)))
+
+    return results
+
+
+resident_loop = None
+
+
+def run(coroutine):
+    if resident_loop:
+        return resident_loop.run_until_complete(coroutine)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def keep_warm():
+    global resident_loop
+    resident_loop = asyncio.new_event_loop()
+    BatchPool.warm = {}
+
+
+def close_warm():
+    global resident_loop
+    for pool in BatchPool.warm.values():
+        run(pool.close())
+    resident_loop.close()
+    resident_loop = None
+    BatchPool.warm = None
@@ -0,0 +1,195 @@
+# Albumin Consistency Checks
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import zlib
+import multiprocessing
+from datetime import datetime
+
+import pytz
+import pygit2
+
+from albumin import metalog
+from albumin.batch import chunks
+from albumin.repo import AlbuminMetadata
+from albumin.repo import AlbuminRepo
+from albumin.repo import arranged_name
+
+# Metadata of all keys and the repo's layout, set by init_worker
+key_fields = {}
+layout = ''
+
+
+def init_worker(fields, layout_=''):
+    global key_fields, layout
+    key_fields = fields
+    layout = layout_
+
+
+def check_files(rows):
+    """
+    Checks that each file's key has a date, that the date agrees with
+    the year, month and day fields, and that the file is named and
+    placed after it.
+    """
+    violations = []
+    for path, key in rows:
+        fields = key_fields.get(key, {})
+
+        def violation(check, expected=None, found=None):
+            violations.append({
+                'check': check, 'path': path, 'key': key,
+                'expected': expected, 'found': found,
+            })
+
+        try:
+            dt = datetime.strptime(
+                fields['datetime'][0], '%Y-%m-%d@%H-%M-%S'
+            )
+        except (KeyError, IndexError, ValueError):
+            violation('undated', found=fields.get('datetime'))
+            continue
+
+        for field, value in [
+            ('year', '{:%Y}'.format(dt)),
+            ('month', '{:%m}'.format(dt)),
+            ('day', '{:%d}'.format(dt)),
+        ]:
+            if fields.get(field) != [value]:
+                violation(field, expected=value, found=fields.get(field))
+
+        name = '{:%Y%m%dT%H%M%SZ}'.format(dt)
+        match = arranged_name.match(os.path.basename(path))
+        if not match or match.group(1) != name:
+            violation('name', expected=name, found=os.path.basename(path))
+
+        folder = dt.strftime(layout) if layout else ''
+        if os.path.dirname(path) != folder:
+            violation('layout', expected=folder, found=os.path.dirname(path))
+
+    return violations
+
+
+def check_reports(rows):
+    """
+    Checks that the imdates in each commit's report were applied, i.e.
+    that the stored imdate of each key is at least as good as them.
+    The rows are (age, commit, message), and each key's result is given
+    as (age, key, violation or None) so that latest_results can keep
+    only the newest one, since a later report may rightly overwrite an
+    earlier one.
+    """
+    from albumin.hooks import parse_commit_msg
+
+    results = []
+    for age, commit, message in rows:
+        try:
+            _, _, report = parse_commit_msg(message.splitlines())
+        except Exception:
+            continue
+
+        for key, (new, _) in report.updates.items():
+            stored = AlbuminMetadata.parse_imdate(key_fields.get(key, {}))
+            violation = None
+            if stored is None or (
+                stored.lexical_key() < new.lexical_key()
+            ) or (
+                stored.method == new.method
+                and stored.datetime.astimezone(pytz.utc)
+                != new.datetime.astimezone(pytz.utc)
+            ):
+                violation = {
+                    'check': 'report', 'commit': commit, 'key': key,
+                    'expected': str(new),
+                    'found': str(stored) if stored else None,
+                }
+            results.append((age, key, violation))
+
+    return results
+
+
+def latest_results(results):
+    """
+    Yields the violations among the newest result of each key.
+    """
+    latest = {}
+    for age, key, violation in results:
+        if key not in latest or age < latest[key][0]:
+            latest[key] = (age, violation)
+    for age, violation in latest.values():
+        if violation is not None:
+            yield violation
+
+
+def index_files(repo):
+    repo.index.read()
+    for entry in repo.index:
+        blob = repo[entry.id]
+        if blob.size > 1024:
+            continue
+        target = blob.data.decode(errors='replace').strip()
+        if '/annex/objects/' in target:
+            yield entry.path, target.split('/')[-1]
+
+
+def report_messages(repo):
+    try:
+        head = repo.head.target
+    except Exception:
+        return
+    trailer = '\n' + AlbuminRepo.report_trailer
+    order = pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME
+    for age, commit in enumerate(repo.walk(head, order)):
+        message = commit.message
+        if trailer in message and '\n[report]\n' not in message:
+            blob = message.split(trailer)[-1].split('\n')[0].strip()
+            try:
+                report = zlib.decompress(repo[blob].data).decode()
+            except (KeyError, ValueError, zlib.error):
+                continue
+            message = '{}\n\n[report]\n{}'.format(message, report)
+        if '\n[report]\n' in message:
+            yield age, str(commit.id), message
+
+
+def check_repo(repo, jobs=None, chunk_size=1000):
+    """
+    Yields violations of the repo's invariants, as dicts. The index and
+    the git-annex branch are read in bulk, and checked in parallel.
+    """
+    repo.merge_annex()
+    fields = {
+        key: fields
+        for key, fields in metalog.read_logs(repo)
+        if fields is not None
+    }
+
+    layout = getattr(repo, 'layout', '')
+    with multiprocessing.Pool(
+        jobs, initializer=init_worker, initargs=(fields, layout)
+    ) as pool:
+        for violations in pool.imap_unordered(
+            check_files, chunks(index_files(repo), chunk_size)
+        ):
+            yield from violations
+
+        yield from latest_results(
+            result
+            for results in pool.imap_unordered(
+                check_reports, chunks(report_messages(repo), 64)
+            )
+            for result in results
+        )
@@ -23,20 +23,55 @@ Usage:
     albumin init [-r=<repo>]
     albumin uninit [-r=<repo>]
     albumin analyze [<path>] [-s] [-m] [-r=<repo>] [-T=<tz>]
-    albumin import <path> [-m] [-r=<repo>] [-T=<tz>] [-t=<tag>:<value>]...
+                    [--shard=<i/n>]
+    albumin merge-reports <report>... [-s]
+    albumin import <path> [-m] [-k] [-r=<repo>] [-T=<tz>] [-c=<n>]
+                   [-t=<tag>:<value>]...
+    albumin watch <path> [-m] [-r=<repo>] [-T=<tz>] [-c=<n>]
+                  [--settle=<s>] [-t=<tag>:<value>]...
     albumin fix [<path>] [-r=<repo>]
+    albumin relayout [-r=<repo>]
+    albumin compact-metadata [-r=<repo>]
     albumin apply [<path>] [-r=<repo>] [-t=<tag>:<value>]...
+    albumin serve [-r=<repo>]
+    albumin query [-r=<repo>] [-T=<tz>] [--from=<date>] [--to=<date>]
+                  [--method=<method>]... [-t=<tag>:<value>]...
+    albumin export <output> [-r=<repo>] [-T=<tz>] [--from=<date>]
+                   [--to=<date>] [--method=<method>]...
+                   [-t=<tag>:<value>]...
+    albumin stats [-r=<repo>] [--monthly] [--rebuild]
+    albumin check [-r=<repo>]
 
 Actions:
     init                    Initialize the repo and set up git hooks
     uninit                  Remove albumin git hooks in the repo
     analyze                 Analyze files in the repo's staging area
-    analyze <path>          Analyze the files at <path>
-    import <path>           Import files from <path>
+    analyze <path>          Analyze the files at <path>, which may be
+                            a tar or zip archive
+    merge-reports           Combine short analysis reports of separate
+                            files, e.g. from each --shard, into one
+    import <path>           Import files from <path>, which may be
+                            a tar or zip archive
+    watch <path>            Import files from <path> as they are
+                            written into it, until interrupted
     fix                     Fix the filenames of all images
     fix <path>              Fix the filenames of images in <path>
+    relayout                Move all images to the folders given by
+                            albumin.layout, in one commit
+    compact-metadata        Rewrite git-annex metadata logs to only
+                            their last change of each value
     apply                   Apply the analysis from stdin to metadata
     apply <path>            Apply the analysis report to metadata
+    serve                   Keep the repo open and run hooks and
+                            commands sent to it over a socket
+    query                   List files by date, method and tags
+    export <output>         Write the files query would list into a
+                            tar at <output> ("-" for stdout), gzipped
+                            unless it ends with .tar
+    stats                   Count dated keys per year and
+                            datetime-method
+    check                   List files and commits whose metadata
+                            disagree, one JSON object per line
 
 Options:
     -r, --repo=<repo>         Git-annex repository to use. [default: .]
@@ -44,38 +79,73 @@ Options:
     -t, --tag=<tag>:<value>   Tags to add to all imported files.
     -s, --short               Print analysis report in the short format
     -m, --mtime               Use file modify time as a valid image date
+    --shard=<i/n>             Only analyze the i'th of n parts of the
+                              files, split by a hash of their paths
+    -k, --keep                Keep the imported files at <path>
+    -c, --chunk=<n>           Commit imports in chunks of <n> files
+                              [default: 1000]
+    --settle=<s>              Wait until files are unchanged for <s>
+                              seconds before importing [default: 2]
+    --from=<date>             Only list or export files from <date>
+                              onwards, as in 2014, 2014-07 or 2014-07-15
+    --to=<date>               Only list or export files up to the end
+                              of <date>
+    --method=<method>         Only list or export files dated by
+                              <method>
+    --monthly                 Count keys per month instead of year
+    --rebuild                 Read the index again from the git-annex
+                              branch before counting
 
 """
 
 import os
 import sys
-import pytz
 from docopt import docopt
 
-import albumin.core
-from albumin.repo import AlbuminRepo
 from albumin.hooks import git_hooks
+from albumin.server import forward
+
+version = '0.1.0'
 
 
 def main():
     name = os.path.basename(sys.argv[0])
-    version = '0.1.0'
+    doc = git_hooks[name].__doc__ if name in git_hooks else __doc__
+    args = docopt(doc, version=version)
+
+    retval = forward(sys.argv, args)
+    if retval is None:
+        retval = run(sys.argv)
+    sys.exit(retval)
+
+
+def run(argv, repo=None):
+    name = os.path.basename(argv[0])
 
     if name in git_hooks:
         hook = git_hooks[name]
-        args = docopt(hook.__doc__, version=version)
+        args = docopt(hook.__doc__, argv=argv[1:], version=version)
         retval = hook(args)
         if retval:
             print('Aborting commit.')
-        sys.exit(retval)
+        return retval
+
+    args = docopt(__doc__, argv=argv[1:], version=version)
 
-    args = docopt(__doc__, version=version)
+    import albumin.core
+    from albumin.repo import AlbuminRepo
+    from albumin.imdate import get_timezone
 
-    if args.get('--repo'):
+    if repo:
+        args['--repo'] = repo
+    elif args.get('--repo'):
         try:
             args['--repo'] = AlbuminRepo(args['--repo'])
         except ValueError:
-            repo_cmds = ['import', 'fix', 'apply']
+            repo_cmds = [
+                'import', 'watch', 'fix', 'relayout', 'compact-metadata',
+                'apply', 'serve', 'query', 'export', 'stats', 'check',
+            ]
             if any(map(args.__getitem__, repo_cmds)):
                 raise
             elif args.get('init'):
@@ -86,7 +156,7 @@ def main():
                 args['--repo'] = None
 
     if args.get('--timezone'):
-        args['--timezone'] = pytz.timezone(args['--timezone'])
+        args['--timezone'] = get_timezone(args['--timezone'])
         if args.get('--repo'):
             args['--repo'].timezone = args['--timezone']
 
@@ -103,24 +173,31 @@ def main():
     if args.get('<path>'):
         args['<path>'] = os.path.realpath(args['<path>'])
 
+    if args.get('--shard'):
+        index, count = map(int, args['--shard'].split('/'))
+        if not 0 < index <= count:
+            raise ValueError(args['--shard'])
+        args['--shard'] = (index - 1, count)
+
     if args.get('analyze') and args.get('--repo'):
         albumin.core.repo_analyze(
             repo=args['--repo'],
             path=args['<path>'],
             short=args['--short'],
             mtime=args['--mtime'],
+            shard=args['--shard'],
         )
 
     elif args.get('init'):
         albumin.core.init(
             repo=args['--repo'],
-            exec_path=sys.argv[0]
+            exec_path=argv[0]
         )
 
     elif args.get('uninit'):
         albumin.core.uninit(
             repo=args['--repo'],
-            exec_path=sys.argv[0]
+            exec_path=argv[0]
         )
 
     elif args.get('analyze'):
@@ -129,6 +206,13 @@ def main():
             short=args['--short'],
             timezone=args['--timezone'],
             mtime=args['--mtime'],
+            shard=args['--shard'],
+        )
+
+    elif args.get('merge-reports'):
+        albumin.core.merge_reports(
+            paths=args['<report>'],
+            short=args['--short'],
         )
 
     elif args.get('import'):
@@ -136,6 +220,18 @@ def main():
             repo=args['--repo'],
             path=args['<path>'],
             mtime=args['--mtime'],
+            chunk_size=int(args['--chunk']),
+            keep=args['--keep'],
+            **args['--tag'],
+        )
+
+    elif args.get('watch'):
+        albumin.core.watch(
+            repo=args['--repo'],
+            path=args['<path>'],
+            mtime=args['--mtime'],
+            chunk_size=int(args['--chunk']),
+            settle=float(args['--settle']),
             **args['--tag'],
         )
 
@@ -145,6 +241,16 @@ def main():
             path=args['<path>'],
         )
 
+    elif args.get('relayout'):
+        albumin.core.relayout(
+            repo=args['--repo'],
+        )
+
+    elif args.get('compact-metadata'):
+        albumin.core.compact_metadata(
+            repo=args['--repo'],
+        )
+
     elif args.get('apply'):
         albumin.core.apply(
             repo=args['--repo'],
@@ -152,5 +258,44 @@ def main():
             **args['--tag'],
         )
 
+    elif args.get('query'):
+        albumin.core.query(
+            repo=args['--repo'],
+            start=args['--from'],
+            end=args['--to'],
+            methods=args['--method'],
+            timezone=args['--timezone'],
+            **args['--tag'],
+        )
+
+    elif args.get('export'):
+        albumin.core.export(
+            repo=args['--repo'],
+            output=args['<output>'],
+            start=args['--from'],
+            end=args['--to'],
+            methods=args['--method'],
+            timezone=args['--timezone'],
+            **args['--tag'],
+        )
+
+    elif args.get('stats'):
+        albumin.core.stats(
+            repo=args['--repo'],
+            monthly=args['--monthly'],
+            rebuild=args['--rebuild'],
+        )
+
+    elif args.get('check'):
+        return albumin.core.check(
+            repo=args['--repo'],
+        )
+
+    elif args.get('serve'):
+        albumin.core.serve(
+            repo=args['--repo'],
+            run=run,
+        )
+
 if __name__ == "__main__":
     main()
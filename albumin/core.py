@@ -17,10 +17,14 @@
 import os
 import sys
 import stat
+import pytz
+import collections
 
 from albumin.utils import files_in
+from albumin.utils import in_shard
 from albumin.imdate import analyze_date
 from albumin.imdate import Report
+from albumin.imdate import ImageDate
 from albumin.hooks import git_hooks
 
 
@@ -81,7 +85,10 @@ def uninit(repo, exec_path):
                 )
 
 
-def import_(repo, path, mtime=False, **tags):
+def import_(repo, path, mtime=False, chunk_size=1000, keep=False,
+            files=None, **tags):
+    from albumin.dateindex import DateIndex
+
     branch = repo.branch()
     if not branch.startswith('refs/heads/') \
             or branch[11:] == 'git-annex' \
@@ -89,20 +96,60 @@ def import_(repo, path, mtime=False, **tags):
         print("Can't import to ref: {}".format(branch))
         return
 
-    report = repo.import_(path, mtime=False, **tags)
+    def commit_msg(report):
+        def lines():
+            yield 'Import {}'.format(path)
+            yield ''
+            yield '[tags]'
+            yield from ('{}: {}'.format(t, v) for t, v in tags.items())
+            yield ''
+            yield from repo.report_section(report)
+        msg = '\n'.join(lines())
+        print(msg, end='\n\n')
+        return msg
+
+    pending, placed = repo.import_journaled(
+        path, commit_msg, mtime=mtime, chunk_size=chunk_size, keep=keep,
+        files=files, **tags
+    )
+
+    strategies = collections.Counter(s for s, _ in placed.values())
+    written = sum(w for _, w in placed.values())
+    print('Placed {} files:'.format(len(placed)))
+    for strategy, count in sorted(strategies.items()):
+        print('  {} {}'.format(count, strategy))
+    print('  {} bytes written'.format(written))
 
-    def commit_msg():
-        yield 'Import {}'.format(path)
-        yield ''
-        yield '[tags]'
-        yield from ('{}: {}'.format(t, v) for t, v in tags.items())
-        yield ''
-        yield '[report]'
-        yield from report.short()
+    if pending:
+        print('Some files have no information and are left staged:')
+        print(*('  {}'.format(f) for f in pending), sep='\n')
 
-    commit_msg = '\n'.join(commit_msg())
-    repo.commit(commit_msg)
-    print(commit_msg)
+    DateIndex.refresh(repo)
+
+
+def watch(repo, path, mtime=False, chunk_size=1000, settle=2.0, **tags):
+    """
+    Imports files as they are written into path, in batches of those
+    that finished together, keeping exiftool and git-annex processes
+    running in between.
+    """
+    import albumin.batch
+    from albumin.watch import Inbox
+
+    albumin.batch.keep_warm()
+    print('Watching {}'.format(path))
+    try:
+        with Inbox(path, settle=settle) as inbox:
+            while True:
+                files = inbox.wait()
+                import_(
+                    repo, path, mtime=mtime, chunk_size=chunk_size,
+                    files=files, **tags
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        albumin.batch.close_warm()
 
 
 def fix(repo, path=None):
@@ -112,7 +159,14 @@ def fix(repo, path=None):
     print(diff_stats)
 
 
+def relayout(repo):
+    moves = repo.relayout()
+    print('Moved {} files.'.format(len(moves)))
+
+
 def apply(repo, path=None, **tags):
+    from albumin.dateindex import DateIndex
+
     if path:
         with open(path, 'r') as file:
             report_msg = [line.strip() for line in file]
@@ -120,12 +174,129 @@ def apply(repo, path=None, **tags):
         report_msg = [line.strip() for line in sys.stdin]
     report = Report.parse(report_msg)
     repo.apply_report(report, **tags)
+    DateIndex.refresh(repo)
+
+
+def query(repo, start=None, end=None, methods=None, timezone=None,
+          **tags):
+    from albumin.dateindex import DateIndex
+    from albumin.dateindex import period
+
+    timezone = timezone or repo.timezone or pytz.utc
+    if start:
+        start, _ = period(start, timezone)
+    if end:
+        _, end = period(end, timezone)
+
+    with DateIndex(repo) as index:
+        index.update()
+        for path, *_ in index.query(start, end, methods, **tags):
+            print(path)
+
+
+def export(repo, output, start=None, end=None, methods=None,
+           timezone=None, **tags):
+    from albumin.dateindex import DateIndex
+    from albumin.dateindex import period
+    from albumin.export import export_tar
+
+    timezone = timezone or repo.timezone or pytz.utc
+    if start:
+        start, _ = period(start, timezone)
+    if end:
+        _, end = period(end, timezone)
+
+    with DateIndex(repo) as index:
+        index.update()
+        paths = [
+            path for path, *_ in index.query(start, end, methods, **tags)
+        ]
+
+    compress = not output.endswith('.tar')
+    if output == '-':
+        exported, missing = export_tar(
+            repo, sys.stdout.buffer, paths, jobs=repo.jobs,
+        )
+    else:
+        with open(output, 'wb') as file:
+            exported, missing = export_tar(
+                repo, file, paths, jobs=repo.jobs, compress=compress,
+            )
+
+    log = sys.stderr if output == '-' else sys.stdout
+    print('Exported {} files, {} bytes.'.format(
+        len(exported), sum(exported.values())
+    ), file=log)
+    if missing:
+        print('Some files have no content here and were left out:',
+              file=log)
+        print(*('  {}'.format(f) for f in missing), sep='\n', file=log)
+
+
+def stats(repo, monthly=False, rebuild=False):
+    from albumin.dateindex import DateIndex
+
+    with DateIndex(repo) as index:
+        if rebuild:
+            index.rebuild()
+        else:
+            index.update()
+        rows = list(index.stats(monthly=monthly))
 
+    totals = collections.Counter()
+    for year, month, method, count in rows:
+        period_ = '{}-{:02}'.format(year, month) if monthly else year
+        print('{:<8} {:>8}  {}'.format(period_, count, method))
+        totals[method] += count
 
-def repo_analyze(repo, path=None, short=False, mtime=False):
+    print('Total:')
+    for method in sorted(totals, key=ImageDate.methods.index):
+        print('  {:>8}  {}'.format(totals[method], method))
+
+
+def check(repo):
+    import json
+    from albumin.check import check_repo
+
+    found = False
+    for violation in check_repo(repo, jobs=repo.jobs):
+        print(json.dumps(violation, sort_keys=True))
+        found = True
+    return 1 if found else 0
+
+
+def compact_metadata(repo):
+    import time
+    from albumin import metalog
+
+    def read_time():
+        list(metalog.read_logs(repo))
+        start = time.perf_counter()
+        list(metalog.read_logs(repo))
+        return time.perf_counter() - start
+
+    time_before = read_time()
+    count, size_before, size_after = repo.compact_metadata()
+    time_after = read_time()
+
+    print('Compacted {} metadata logs.'.format(count))
+    print('  Size: {} -> {} bytes'.format(size_before, size_after))
+    print('  Reading all: {:.3f}s -> {:.3f}s'.format(
+        time_before, time_after
+    ))
+
+
+def serve(repo, run):
+    import albumin.server
+
+    albumin.server.serve(repo, run)
+
+
+def repo_analyze(repo, path=None, short=False, mtime=False, shard=None):
     report = repo.analyze(
         path=path,
         mtime=mtime,
+        shard=shard,
     )
 
     if short:
@@ -134,12 +305,45 @@ def repo_analyze(repo, path=None, short=False, mtime=False):
         print(report)
 
 
-def imdate_analyze(path, timezone=None, short=False, mtime=False):
-    report = analyze_date(
-        *files_in(path),
-        timezone=timezone,
-        mtime=mtime,
-    )
+def imdate_analyze(path, timezone=None, short=False, mtime=False,
+                   shard=None):
+    from albumin.archive import is_archive
+    from albumin.archive import archive_heads
+    from albumin.archive import renamed_report
+
+    if is_archive(path):
+        with archive_heads(path) as heads:
+            report = analyze_date(
+                *(h for h, (n, _) in heads.items() if in_shard(n, shard)),
+                timezone=timezone,
+                mtime=mtime,
+            )
+            report = renamed_report(report, {
+                head: os.path.join(path, name)
+                for head, (name, _) in heads.items()
+            })
+    else:
+        report = analyze_date(
+            *(
+                file for file in files_in(path)
+                if in_shard(os.path.relpath(file, path), shard)
+            ),
+            timezone=timezone,
+            mtime=mtime,
+        )
+
+    if short:
+        print(*report.short(), sep='\n')
+    else:
+        print(report)
+
+
+def merge_reports(paths, short=False):
+    reports = []
+    for path in paths:
+        with open(path, 'r') as file:
+            reports.append(Report.parse(line.strip() for line in file))
+    report = Report.merge(*reports)
 
     if short:
         print(*report.short(), sep='\n')
@@ -0,0 +1,305 @@
+# Albumin Date Index
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import sqlite3
+import calendar
+from datetime import datetime
+from datetime import timedelta
+
+import pytz
+import pygit2
+
+from albumin import metalog
+from albumin.imdate import ImageDate
+from albumin.repo import AlbuminAnnex
+from albumin.utils import walk_tree
+
+
+class DateIndex:
+    """
+    A local SQLite table of every key's imdate metadata, its files in
+    HEAD and its user tags, kept up to date from git-annex branch and
+    HEAD commits incrementally. The number of dated keys in each month
+    for each datetime-method is kept along with them.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS dates (
+            key TEXT PRIMARY KEY,
+            epoch INTEGER,
+            rank INTEGER,
+            method TEXT,
+            timezone TEXT
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            key TEXT
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            key TEXT,
+            tag TEXT,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS counts (
+            year INTEGER,
+            month INTEGER,
+            rank INTEGER,
+            count INTEGER,
+            PRIMARY KEY (year, month, rank)
+        );
+        CREATE INDEX IF NOT EXISTS dates_epoch ON dates (epoch);
+        CREATE INDEX IF NOT EXISTS files_key ON files (key);
+        CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag, value);
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        path = self.index_path(repo)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript(self.schema)
+
+    @staticmethod
+    def index_path(repo):
+        return os.path.join(repo.path, 'albumin', 'dates.sqlite')
+
+    @classmethod
+    def refresh(cls, repo):
+        """
+        Brings the repo's index up to date if it has one, so that it
+        doesn't fall far behind between queries.
+        """
+        if os.path.exists(cls.index_path(repo)):
+            with cls(repo) as index:
+                index.update()
+
+    def get_state(self, name):
+        row = self.db.execute(
+            'SELECT value FROM state WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, name, value):
+        self.db.execute(
+            'INSERT OR REPLACE INTO state VALUES (?, ?)', (name, value)
+        )
+
+    def tree_state(self, name):
+        oid = self.get_state(name)
+        return self.repo[oid] if oid else None
+
+    def update(self):
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            if self.get_state('counts') is None:
+                self.rebuild_counts()
+
+            old_tree = self.tree_state('git-annex')
+            for key, fields in metalog.read_logs(self.repo, old_tree):
+                self.update_key(key, fields)
+
+            new_tree = metalog.branch_tree(self.repo)
+            if new_tree is not None:
+                self.set_state('git-annex', str(new_tree.id))
+
+            self.update_files()
+
+    def rebuild(self):
+        """
+        Forgets everything and reads it again from the git-annex branch
+        and HEAD, e.g. if the index was damaged.
+        """
+        with self.db:
+            for table in ['state', 'dates', 'files', 'tags', 'counts']:
+                self.db.execute('DELETE FROM {}'.format(table))
+        self.update()
+
+    def rebuild_counts(self):
+        self.db.execute('DELETE FROM counts')
+        self.db.execute(
+            "INSERT INTO counts SELECT "
+            "CAST(strftime('%Y', epoch, 'unixepoch') AS INTEGER), "
+            "CAST(strftime('%m', epoch, 'unixepoch') AS INTEGER), "
+            "rank, COUNT(*) FROM dates GROUP BY 1, 2, 3"
+        )
+        self.set_state('counts', 'month')
+
+    def count_key(self, key, delta):
+        row = self.db.execute(
+            'SELECT epoch, rank FROM dates WHERE key = ?', (key,)
+        ).fetchone()
+        if not row:
+            return
+        epoch, rank = row
+        utc = time.gmtime(epoch)
+        bucket = (utc.tm_year, utc.tm_mon, rank)
+        self.db.execute(
+            'INSERT OR IGNORE INTO counts VALUES (?, ?, ?, 0)', bucket
+        )
+        self.db.execute(
+            'UPDATE counts SET count = count + ? '
+            'WHERE year = ? AND month = ? AND rank = ?',
+            (delta, *bucket),
+        )
+
+    def update_key(self, key, fields):
+        self.count_key(key, -1)
+        self.db.execute('DELETE FROM dates WHERE key = ?', (key,))
+        self.db.execute('DELETE FROM tags WHERE key = ?', (key,))
+        if not fields:
+            return
+
+        dt = fields.get('datetime', [None])[0]
+        method = fields.get('datetime-method', [None])[0]
+        timezone = fields.get('timezone', [None])[0]
+        if dt and method in ImageDate.methods:
+            epoch = calendar.timegm(time.strptime(dt, '%Y-%m-%d@%H-%M-%S'))
+            rank = ImageDate.methods.index(method)
+            self.db.execute(
+                'INSERT INTO dates VALUES (?, ?, ?, ?, ?)',
+                (key, epoch, rank, method, timezone),
+            )
+            self.count_key(key, 1)
+
+        self.db.executemany(
+            'INSERT INTO tags VALUES (?, ?, ?)',
+            (
+                (key, tag, value)
+                for tag, values in fields.items()
+                if tag not in AlbuminAnnex.internal_tags
+                and not tag.endswith('lastchanged')
+                for value in values
+            ),
+        )
+
+    def update_files(self):
+        try:
+            new_tree = self.repo.head.peel(pygit2.Commit).tree
+        except pygit2.GitError:
+            return
+        old_tree = self.tree_state('HEAD')
+
+        if old_tree is None:
+            self.db.execute('DELETE FROM files')
+            changes = walk_tree(self.repo, new_tree)
+        else:
+            changes = (
+                (patch.delta.new_file.path, None)
+                if patch.delta.status == pygit2.GIT_DELTA_DELETED
+                else (patch.delta.new_file.path, patch.delta.new_file.id)
+                for patch in self.repo.diff(old_tree, new_tree)
+            )
+
+        for path, oid in changes:
+            self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+            if oid is None or self.repo[oid].size > 1024:
+                continue
+            key = self.repo[oid].data.decode(errors='replace')
+            key = key.strip().split('/')[-1]
+            self.db.execute('INSERT INTO files VALUES (?, ?)', (path, key))
+
+        self.set_state('HEAD', str(new_tree.id))
+
+    def query(self, start=None, end=None, methods=None, **tags):
+        where, params = [], []
+
+        if start is not None:
+            where.append('dates.epoch >= ?')
+            params.append(int(start.timestamp()))
+
+        if end is not None:
+            where.append('dates.epoch < ?')
+            params.append(int(end.timestamp()))
+
+        if methods:
+            marks = ', '.join('?' * len(methods))
+            where.append('dates.method IN ({})'.format(marks))
+            params.extend(methods)
+
+        for tag, value in tags.items():
+            where.append(
+                'EXISTS (SELECT 1 FROM tags WHERE tags.key = dates.key '
+                'AND tags.tag = ? AND tags.value = ?)'
+            )
+            params.extend((tag, value))
+
+        sql = (
+            'SELECT files.path, dates.key, dates.epoch, '
+            'dates.method, dates.timezone '
+            'FROM dates JOIN files ON files.key = dates.key'
+        )
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY dates.epoch, files.path'
+
+        return self.db.execute(sql, params)
+
+    def stats(self, monthly=False):
+        """
+        Yields the number of dated keys in each year (or month) for each
+        datetime-method, as (year, month or None, method, count).
+        """
+        rows = self.db.execute(
+            'SELECT year, {}, rank, SUM(count) FROM counts '
+            'GROUP BY 1, 2, 3 HAVING SUM(count) > 0 '
+            'ORDER BY 1, 2, 3'.format('month' if monthly else 'NULL')
+        )
+        for year, month, rank, count in rows:
+            yield year, month, ImageDate.methods[rank], count
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return 'DateIndex(repo={!r})'.format(self.repo)
+
+
+def period(text, timezone=pytz.utc):
+    """
+    Parses a date like 2014, 2014-07 or 2014-07-15 into the half-open
+    range of datetimes it covers, in the given timezone.
+    """
+    formats = [
+        ('%Y', lambda d: d.replace(year=d.year + 1)),
+        ('%Y-%m', lambda d: d.replace(
+            year=d.year + d.month // 12, month=d.month % 12 + 1
+        )),
+        ('%Y-%m-%d', lambda d: d + timedelta(days=1)),
+        ('%Y-%m-%dT%H:%M:%S', lambda d: d + timedelta(seconds=1)),
+    ]
+
+    for fmt, next_ in formats:
+        try:
+            start = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        end = next_(start)
+        return timezone.localize(start), timezone.localize(end)
+
+    raise ValueError(text)
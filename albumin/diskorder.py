@@ -0,0 +1,84 @@
+# Albumin Disk Ordering
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import fcntl
+import struct
+
+FS_IOC_FIEMAP = 0xC020660B
+fiemap_header = struct.Struct('=QQIIII')
+fiemap_extent = struct.Struct('=QQQQQIIII')
+
+
+def first_extent(fd):
+    """
+    Returns the physical offset of the file's first extent, or None if
+    the filesystem can't tell (or the file has no extents).
+    """
+    buf = bytearray(fiemap_header.size + fiemap_extent.size)
+    fiemap_header.pack_into(buf, 0, 0, 2**64 - 1, 0, 0, 1, 0)
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, buf)
+    except OSError:
+        return None
+
+    *_, mapped, _, _ = fiemap_header.unpack_from(buf)
+    if not mapped:
+        return None
+    _, physical, *_ = fiemap_extent.unpack_from(buf, fiemap_header.size)
+    return physical
+
+
+def placement(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return (-1, -1, -1)
+    try:
+        st = os.fstat(fd)
+        physical = first_extent(fd)
+    finally:
+        os.close(fd)
+    return (st.st_dev, -1 if physical is None else physical, st.st_ino)
+
+
+def disk_order(paths):
+    """
+    Sorts paths by where their files are on disk: by the first extent
+    where the filesystem supports FIEMAP, by inode number otherwise.
+    Reading them in this order avoids seeking on spinning disks.
+    """
+    return sorted(paths, key=placement)
+
+
+def readahead(paths, length=0):
+    """
+    Asks the kernel to start reading the first length bytes (or all)
+    of the files in the background, so they are cached when needed.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
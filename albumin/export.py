@@ -0,0 +1,132 @@
+# Albumin Export
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import zlib
+import tarfile
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from albumin.batch import jobs as cpu_jobs
+from albumin.diskorder import readahead
+
+
+def gzip_member(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class GzipBlocks:
+    """
+    A write-only file that gzips what is written to it in blocks, each
+    compressed on its own thread into a separate gzip member, and writes
+    them to fileobj in order. Concatenated gzip members are one valid
+    gzip file, which gzip and tar read as a whole.
+    """
+
+    def __init__(self, fileobj, jobs=None, block_size=2**20, level=6):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.level = level
+        self.jobs = jobs or cpu_jobs()
+        self.executor = ThreadPoolExecutor(self.jobs)
+        self.buffer = bytearray()
+        self.pending = collections.deque()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def _submit(self, block):
+        self.pending.append(
+            self.executor.submit(gzip_member, block, self.level)
+        )
+        while len(self.pending) > 2 * self.jobs:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().result())
+        self.executor.shutdown()
+        self.fileobj.flush()
+
+    def __repr__(self):
+        return 'GzipBlocks(jobs={})'.format(self.jobs)
+
+
+def annexed_content(path):
+    """
+    The path to read the content of the annexed file from, or None if
+    the content isn't in the repo: the symlink is broken, or the file
+    is the pointer git-annex leaves in place of an unlocked file.
+    """
+    if os.path.islink(path):
+        content = os.path.realpath(path)
+        return content if os.path.isfile(content) else None
+
+    try:
+        with open(path, 'rb') as file:
+            head = file.read(1025)
+    except OSError:
+        return None
+    if len(head) <= 1024 and head.startswith(b'/annex/objects/'):
+        return None
+    return path
+
+
+def export_tar(repo, fileobj, paths, jobs=None, compress=True):
+    """
+    Writes the annexed contents of the paths in the repo as a tar to
+    fileobj, gzipped in parallel unless compress is False. Files are
+    read ahead a few at a time while the previous ones are archived.
+    Returns the paths that were exported with their sizes, and those
+    whose content isn't in the repo.
+    """
+    jobs = jobs or cpu_jobs()
+    window = 2 * jobs
+
+    present, missing = [], []
+    for path in paths:
+        content = annexed_content(repo.abs_path(path))
+        if content:
+            present.append((path, content))
+        else:
+            missing.append(path)
+
+    out = GzipBlocks(fileobj, jobs=jobs) if compress else fileobj
+    exported = collections.OrderedDict()
+    readahead(content for _, content in present[:window])
+
+    with tarfile.open(fileobj=out, mode='w|') as tar:
+        for i, (path, content) in enumerate(present):
+            readahead(c for _, c in present[i + window:i + window + 1])
+            with open(content, 'rb') as file:
+                info = tar.gettarinfo(arcname=path, fileobj=file)
+                info.mode = 0o644
+                info.uid = info.gid = 0
+                info.uname = info.gname = ''
+                tar.addfile(info, file)
+            exported[path] = info.size
+
+    if compress:
+        out.close()
+    return exported, missing
@@ -15,10 +15,9 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import pytz
+import subprocess
 
-from albumin.repo import AlbuminRepo
-from albumin.imdate import Report
+resident_repo = None
 
 
 def pre_commit_hook(args):
@@ -26,17 +25,20 @@ def pre_commit_hook(args):
     Albumin as a pre-commit hook.
     Usage: pre-commit
     """
-    repo = current_repo()
-    msg_path = os.path.join(repo.path, 'albumin.msg')
-    new_files = repo.new_files()
-
-    branch = repo.branch()
+    branch = current_branch()
     if not branch.startswith('refs/heads/') \
             or branch[11:] == 'git-annex' \
             or '/' in branch[11:]:
-        print(repo.annex.pre_commit())
+        subprocess.call(['git', 'annex', 'pre-commit', '.'])
         return
 
+    import pytz
+    from albumin.imdate import Report
+
+    repo = current_repo()
+    msg_path = os.path.join(repo.path, 'albumin.msg')
+    new_files = repo.new_files()
+
     override = repo.get_config('albumin.override')
     if override:
         print('Overriding analysis with manual report.')
@@ -92,14 +94,14 @@ def prepare_commit_msg_hook(args):
     Albumin as a pre-commit git hook.
     Usage: prepare-commit-msg <editmsg> [[<commit_type>] <commit_sha>]
     """
-    repo = current_repo()
-    msg_path = os.path.join(repo.path, 'albumin.msg')
-
-    branch = repo.branch()
+    branch = current_branch()
     if branch.startswith('refs/heads/views/') \
             or branch[11:] == 'git-annex':
         return
 
+    repo = current_repo()
+    msg_path = os.path.join(repo.path, 'albumin.msg')
+
     try:
         with open(msg_path, 'r') as msg_file:
             report = [line.strip() for line in msg_file]
@@ -146,13 +148,13 @@ def commit_msg_hook(args):
     Albumin as a pre-commit git hook.
     Usage: commit-msg <editmsg>
     """
-    repo = current_repo()
-
-    branch = repo.branch()
+    branch = current_branch()
     if branch.startswith('refs/heads/views/') \
             or branch[11:] == 'git-annex':
         return
 
+    repo = current_repo()
+
     with open(args['<editmsg>'], 'r') as editmsg:
         msg = (line.strip() for line in editmsg)
         msg = [line for line in msg if not line.startswith('#')]
@@ -168,9 +170,7 @@ def commit_msg_hook(args):
         print(*report.remaining, sep='\n')
         return 1
 
-    new_files = {
-        os.path.basename(f): k for f, k in repo.new_files().items()
-    }
+    new_files = repo.new_files()
 
     for file, key in report.files.items():
         name = os.path.basename(file)
@@ -186,9 +186,7 @@ def commit_msg_hook(args):
             print(file, key, sep='\n')
             return 2
 
-        utc = imdate.datetime.astimezone(pytz.utc)
-        ext = os.path.splitext(key)[1]
-        dt_name = '{:%Y%m%dT%H%M%SZ}{{:02}}{}'.format(utc, ext)
+        dt_name = repo.datetime_name(key, key, {key: imdate})
 
         for i in range(100):
             new_name = dt_name.format(i)
@@ -217,8 +215,7 @@ def commit_msg_hook(args):
             yield from ('{}: {}'.format(t, v) for t, v in tags.items())
         if report:
             yield ''
-            yield '[report]'
-            yield from report.short()
+            yield from repo.report_section(report)
 
     with open(args['<editmsg>'], 'w') as editmsg:
         print(*new_message(), sep='\n', file=editmsg)
@@ -229,24 +226,30 @@ def post_commit_hook(args):
     Albumin as a post-commit git hook.
     Usage: post-commit
     """
-    repo = current_repo()
-
-    branch = repo.branch()
+    branch = current_branch()
     if branch.startswith('refs/heads/views/') \
             or branch[11:] == 'git-annex':
         return
 
+    repo = current_repo()
+
     msg_head, tags, report = parse_commit_msg()
     repo.apply_report(report, **tags)
 
+    commit = repo.head.peel()
+    repo.keep_report(commit.id, commit.message)
+
     msg_path = os.path.join(repo.path, 'albumin.msg')
     if os.path.exists(msg_path):
         os.remove(msg_path)
 
 
-def parse_commit_msg(msg=None):
+def parse_commit_msg(msg=None, repo=None):
+    from albumin.imdate import Report
+    from albumin.repo import AlbuminRepo
+
     if msg is None:
-        repo = current_repo()
+        repo = repo or current_repo()
         msg = repo.head.get_object().message.splitlines()
     msg = [m for m in msg if not m.startswith('#')]
 
@@ -254,6 +257,8 @@ def parse_commit_msg(msg=None):
     for line in msg:
         if line.startswith('[') and line.endswith(']'):
             break
+        if line.startswith(AlbuminRepo.report_trailer):
+            break
         msg_head.append(line)
 
     if not msg_head[-1]:
@@ -273,15 +278,36 @@ def parse_commit_msg(msg=None):
             return msg[idx:idx+len_]
 
     tags = dict(x.split(': ') for x in section('[tags]'))
-    report = Report.parse(section('[report]'))
+
+    trailer = AlbuminRepo.report_trailer
+    blobs = [m[len(trailer):] for m in msg if m.startswith(trailer)]
+    if blobs and '[report]' not in msg:
+        report = (repo or current_repo()).load_report(blobs[-1].strip())
+    else:
+        report = Report.parse(section('[report]'))
 
     return msg_head, tags, report
 
 
 def current_repo():
+    if resident_repo:
+        return resident_repo
+
+    from albumin.repo import AlbuminRepo
     return AlbuminRepo(os.getcwd(), create=False)
 
 
+def current_branch():
+    try:
+        output = subprocess.check_output(
+            ['git', 'symbolic-ref', '-q', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        )
+    except subprocess.CalledProcessError:
+        return 'HEAD'
+    return output.decode().strip()
+
+
 git_hooks = {
     'pre-commit': pre_commit_hook,
     'prepare-commit-msg': prepare_commit_msg_hook,
@@ -19,10 +19,13 @@ import re
 import pytz
 import itertools
 from functools import partial
+from functools import lru_cache
 from datetime import datetime
 from collections import OrderedDict
 
 from albumin.utils import exiftool_tags
+from albumin.tzgrid import timezone_at
+from albumin.diskorder import disk_order
 from albumin.lexical_ordering import lexical_ordering
 
 
@@ -67,32 +70,95 @@ def from_exif(*paths, mtime=False):
     if mtime:
         useful_tags.append('File:FileModifyDate')
 
-    tags_dict = exiftool_tags(*paths)
+    timezone_tags = [
+        'EXIF:OffsetTimeOriginal',
+        'EXIF:OffsetTimeDigitized',
+        'EXIF:OffsetTime',
+        'Composite:GPSLatitude',
+        'Composite:GPSLongitude',
+    ]
 
-    imdates = {}
-    for file, tags in tags_dict.items():
-        if 'RIFF:DateCreated' in tags and 'RIFF:TimeCreated' in tags:
-            date = tags.pop('RIFF:DateCreated')
-            time = tags.pop('RIFF:TimeCreated')
-            tags['RIFF:DateTimeCreated'] = '{} {}'.format(date, time)
+    return exiftool_tags(
+        *disk_order(paths),
+        tags=useful_tags + timezone_tags,
+        reduce=partial(exif_imdate, useful_tags=useful_tags),
+    )
 
-        if 'File:Comment' in tags:
-            tags['File:Comment'] = tags['File:Comment'][:28]
 
-        if mtime and 'File:FileModifyDate' in tags:
-            tags['File:FileModifyDate'] = \
-                tags['File:FileModifyDate'][:19]
+def exif_imdate(file, tags, useful_tags):
+    if 'RIFF:DateCreated' in tags and 'RIFF:TimeCreated' in tags:
+        date = tags.pop('RIFF:DateCreated')
+        time = tags.pop('RIFF:TimeCreated')
+        tags['RIFF:DateTimeCreated'] = '{} {}'.format(date, time)
 
-        for tag, dt in tags.items():
-            if tag not in useful_tags:
-                continue
-            try:
-                tag = 'ExifTool/' + tag.replace(':', '/')
-                imdate = ImageDate(tag, dt)
-                imdates[file] = max(imdates.get(file), imdate)
-            except ValueError:
-                continue
-    return imdates
+    if 'File:Comment' in tags:
+        tags['File:Comment'] = tags['File:Comment'][:28]
+
+    if 'File:FileModifyDate' in tags:
+        tags['File:FileModifyDate'] = tags['File:FileModifyDate'][:19]
+
+    best = None
+    for tag, dt in tags.items():
+        if tag not in useful_tags:
+            continue
+        try:
+            tag = 'ExifTool/' + tag.replace(':', '/')
+            imdate = ImageDate(tag, dt)
+            best = max(best, imdate)
+        except ValueError:
+            continue
+
+    if best is not None:
+        exif_timezone(best, tags)
+    return best
+
+
+def exif_timezone(imdate, tags):
+    """
+    Sets the imdate's timezone to the one at the file's GPS position if
+    it agrees with the offset EXIF recorded for it, or to the recorded
+    offset if only that is known.
+    """
+    offset_tags = {
+        'ExifTool/EXIF/DateTimeOriginal': 'EXIF:OffsetTimeOriginal',
+        'ExifTool/MakerNotes/DateTimeOriginal': 'EXIF:OffsetTimeOriginal',
+        'ExifTool/EXIF/CreateDate': 'EXIF:OffsetTimeDigitized',
+        'ExifTool/MakerNotes/CreateDate': 'EXIF:OffsetTimeDigitized',
+        'ExifTool/EXIF/ModifyDate': 'EXIF:OffsetTime',
+    }
+
+    if imdate.method == 'ExifTool/File/FileModifyDate':
+        return
+
+    offset = parse_offset(tags.get(offset_tags.get(imdate.method)))
+
+    zone = None
+    try:
+        lat = float(tags['Composite:GPSLatitude'])
+        lon = float(tags['Composite:GPSLongitude'])
+    except (KeyError, TypeError, ValueError):
+        pass
+    else:
+        zone = timezone_at(lat, lon)
+
+    if zone:
+        localized = get_timezone(zone).localize(imdate.datetime)
+        utcoffset = localized.utcoffset().total_seconds() // 60
+        if offset is None or offset == utcoffset:
+            imdate.timezone = zone
+            return
+
+    if offset is not None and offset % 60 == 0:
+        imdate.timezone = 'Etc/GMT{:+d}'.format(-offset // 60)
+
+
+def parse_offset(text):
+    match = re.match(r'([+-])(\d\d):?(\d\d)$', str(text or ''))
+    if not match:
+        return None
+    sign, hours, minutes = match.groups()
+    offset = int(hours) * 60 + int(minutes)
+    return -offset if sign == '-' else offset
 
 
 def from_filename(*paths):
@@ -116,6 +182,11 @@ def from_filename(*paths):
     return imdates
 
 
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    return pytz.timezone(name)
+
+
 @lexical_ordering
 class ImageDate:
     methods = [
@@ -181,13 +252,14 @@ class ImageDate:
         datetime_, info = imdate_str.split(' @ ')
         timezone, method = info.strip('()').split(') (')
         datetime_ = datetime.strptime(datetime_, '%Y-%m-%d %H:%M:%S')
-        datetime_ = pytz.timezone(timezone).localize(datetime_)
+        datetime_ = get_timezone(timezone).localize(datetime_)
         return cls(method, datetime_)
 
     @property
     def timezone(self):
         try:
-            return self.datetime.tzinfo.tzname(None)
+            tzinfo = self.datetime.tzinfo
+            return getattr(tzinfo, 'zone', None) or tzinfo.tzname(None)
         except:
             return None
 
@@ -197,7 +269,7 @@ class ImageDate:
             return
 
         if isinstance(tz, str):
-            tz = pytz.timezone(tz)
+            tz = get_timezone(tz)
 
         if self.timezone:
             self.datetime = self.datetime.astimezone(tz)
@@ -336,6 +408,34 @@ class Report(object):
 
         return report
 
+    @classmethod
+    def merge(cls, *reports):
+        """
+        Combines reports of separate files, keeping the best new imdate
+        of each key like AlbuminRepo.imdate_diff, and raising an error
+        if two of them are of the same method but different datetimes.
+        """
+        files, remaining, news, olds = {}, {}, {}, {}
+        for report in reports:
+            files.update(report.files)
+            remaining.update(report.remaining)
+            for key, (new, old) in report.updates.items():
+                news.setdefault(key, []).append(new)
+                olds[key] = olds.get(key) or old
+
+        updates = {}
+        for key, imdates in news.items():
+            new = max(imdates)
+            for imdate in imdates:
+                if imdate.method == new.method \
+                        and imdate.datetime != new.datetime:
+                    raise RuntimeError(key, imdate, new)
+            updates[key] = (new, olds[key])
+
+        report = cls(files, updates, remaining)
+        report.has_keys = all(r.has_keys for r in reports)
+        return report
+
     @property
     def updates(self):
         value = {}
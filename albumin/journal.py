@@ -0,0 +1,134 @@
+# Albumin Import Journal
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from collections import OrderedDict
+
+from albumin.imdate import ImageDate
+
+
+class ImportJournal:
+    """
+    Per-file progress of an import, appended to as each file passes a
+    stage so that an interrupted import can continue where it stopped.
+    Each source path has its own journal, so imports of different
+    paths can run at the same time. Files left pending by the previous
+    run are analyzed again, unless retry is False.
+    Files move through these stages in order:
+
+        keyed       annexed by git-annex import, with its key
+        dated       analyzed, with its new and old imdates
+        pending     analyzed, but no date was found
+        metadata    imdate and tags written to git-annex metadata, and
+                    then the dest it is going to be committed at
+        arranged    committed under its imdate name
+    """
+
+    stages = ['keyed', 'dated', 'pending', 'metadata', 'arranged']
+
+    def __init__(self, repo, source, retry=True):
+        digest = hashlib.md5(source.encode(errors='surrogateescape'))
+        self.path = os.path.join(
+            repo.path, 'albumin', 'imports',
+            '{}.journal'.format(digest.hexdigest()),
+        )
+        self.source = source
+        self.files = OrderedDict()
+
+        lines = []
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+
+        if lines and lines[0].get('source') != source:
+            msg = 'Unfinished import of {}, resume that first.'
+            raise RuntimeError(msg.format(lines[0].get('source')))
+
+        for entry in lines[1:]:
+            self.files.setdefault(entry['file'], {}).update(entry)
+
+        for entry in self.files.values():
+            if retry and entry['stage'] == 'pending':
+                entry['stage'] = 'keyed'
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a')
+        if lines:
+            self._file.write('\n')
+        else:
+            self._write({'source': source})
+
+    def _write(self, entry):
+        print(json.dumps(entry), file=self._file)
+        self._file.flush()
+
+    def record(self, file, stage, **info):
+        if stage not in self.stages:
+            raise ValueError(stage)
+        entry = dict(info, file=file, stage=stage)
+        self.files.setdefault(file, {}).update(entry)
+        self._write(entry)
+
+    def at(self, *stages):
+        return OrderedDict(
+            (file, entry) for file, entry in self.files.items()
+            if entry['stage'] in stages
+        )
+
+    @property
+    def pending(self):
+        return self.at('pending')
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def finish(self):
+        self._file.close()
+        if not self.pending:
+            os.remove(self.path)
+
+    def __repr__(self):
+        return 'ImportJournal(source={!r})'.format(self.source)
+
+
+def dump_imdate(imdate):
+    if imdate is None:
+        return None
+    dt = imdate.datetime.replace(tzinfo=None)
+    return {
+        'method': imdate.method,
+        'datetime': dt.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+        'timezone': imdate.timezone,
+    }
+
+
+def load_imdate(data):
+    if data is None:
+        return None
+    dt = datetime.strptime(data['datetime'], '%Y-%m-%dT%H:%M:%S.%f')
+    imdate = ImageDate(data['method'], dt)
+    imdate.timezone = data['timezone']
+    return imdate
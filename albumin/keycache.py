@@ -0,0 +1,86 @@
+# Albumin Key Cache
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import sqlite3
+
+
+class KeyCache:
+    """
+    Remembers the annex key of files by their stat signature (device,
+    inode, size, mtime and ctime), like git's index does, so unchanged
+    files don't need to be hashed again. Files modified too recently
+    to tell apart from a later change are not cached. Keys are found
+    with a backend only if they were computed with that backend.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS keys (
+            path TEXT PRIMARY KEY,
+            dev INTEGER,
+            ino INTEGER,
+            size INTEGER,
+            mtime_ns INTEGER,
+            ctime_ns INTEGER,
+            key TEXT
+        );
+    """
+
+    racy_ns = 2 * 10**9
+
+    def __init__(self, repo):
+        path = os.path.join(repo.path, 'albumin', 'keys.sqlite')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript(self.schema)
+
+    @staticmethod
+    def signature(st):
+        return (
+            st.st_dev, st.st_ino, st.st_size,
+            st.st_mtime_ns, st.st_ctime_ns,
+        )
+
+    def get(self, path, st, backend=None):
+        row = self.db.execute(
+            'SELECT dev, ino, size, mtime_ns, ctime_ns, key '
+            'FROM keys WHERE path = ?', (os.path.abspath(path),)
+        ).fetchone()
+        if not row or tuple(row[:5]) != self.signature(st):
+            return None
+        if backend and not row[5].startswith(backend + '-'):
+            return None
+        return row[5]
+
+    def put(self, path, key, st):
+        now = time.time() * 10**9
+        if now - max(st.st_mtime_ns, st.st_ctime_ns) < self.racy_ns:
+            return
+        self.db.execute(
+            'INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(path), *self.signature(st), key),
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __repr__(self):
+        return 'KeyCache()'
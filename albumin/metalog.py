@@ -0,0 +1,224 @@
+# Albumin Metadata Logs
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Reads git-annex's per-key metadata logs (the .log.met files on the
+git-annex branch and in the annex journal) directly, so that bulk
+operations don't need a git-annex round-trip for every key.
+"""
+
+import os
+import base64
+import hashlib
+import pygit2
+
+from albumin.utils import walk_tree
+
+log_suffix = '.log.met'
+
+
+def key_from_path(path):
+    name = os.path.basename(path)[:-len(log_suffix)]
+    replacements = {'&a': '&', '&s': '%', '&c': ':'}
+
+    key, i = [], 0
+    while i < len(name):
+        if name[i] == '%':
+            key.append('/')
+            i += 1
+        elif name[i:i+2] in replacements:
+            key.append(replacements[name[i:i+2]])
+            i += 2
+        else:
+            key.append(name[i])
+            i += 1
+    return ''.join(key)
+
+
+def key_file(key):
+    replacements = {'&': '&a', '%': '&s', ':': '&c', '/': '%'}
+    return ''.join(replacements.get(c, c) for c in key)
+
+
+def key_log_path(key):
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return '{}/{}/{}{}'.format(
+        digest[:3], digest[3:6], key_file(key), log_suffix
+    )
+
+
+def journal_path(path):
+    return path.replace('_', '__').replace('/', '_')
+
+
+def journal_unmangle(name):
+    return '_'.join(p.replace('_', '/') for p in name.split('__'))
+
+
+def decode_value(value):
+    if value.startswith('!'):
+        return base64.b64decode(value[1:]).decode()
+    return value
+
+
+def parse_log(text):
+    """
+    Returns the current value set of each field in a metadata log.
+    """
+    lines = []
+    for line in text.splitlines():
+        timestamp, *tokens = line.split()
+        lines.append((float(timestamp.rstrip('s')), tokens))
+    lines.sort(key=lambda l: l[0])
+
+    fields = {}
+    for timestamp, tokens in lines:
+        field = None
+        for token in tokens:
+            if token[0] == '+':
+                fields.setdefault(field, set()).add(decode_value(token[1:]))
+            elif token[0] == '-':
+                fields.setdefault(field, set()).discard(
+                    decode_value(token[1:])
+                )
+            else:
+                field = token
+
+    return {f: sorted(v) for f, v in fields.items() if v}
+
+
+def compact_log(text):
+    """
+    Rewrites a metadata log to only its last change of each value of
+    each field, like git-annex's simplifyLog: the value's addition or
+    removal, at the time it was made. Removals are kept so that values
+    don't come back when the log is union-merged with an older copy
+    of it from another clone.
+    """
+    lines = []
+    for line in text.splitlines():
+        timestamp, *tokens = line.split()
+        lines.append((float(timestamp.rstrip('s')), timestamp, tokens))
+    lines.sort(key=lambda l: l[0])
+
+    changes = {}
+    for _, timestamp, tokens in lines:
+        field = None
+        for token in tokens:
+            if token[0] in '+-':
+                changes[field, token[1:]] = (timestamp, token[0])
+            else:
+                field = token
+
+    by_time = {}
+    for (field, value), (timestamp, sign) in changes.items():
+        by_time.setdefault(timestamp, {}).setdefault(field, []).append(
+            sign + value
+        )
+
+    def line(timestamp, fields):
+        tokens = [timestamp]
+        for field, values in sorted(fields.items()):
+            tokens.append(field)
+            tokens.extend(sorted(values, key=lambda v: (v[1:], v[0])))
+        return ' '.join(tokens) + '\n'
+
+    return ''.join(
+        line(timestamp, by_time[timestamp])
+        for timestamp in sorted(by_time, key=lambda t: float(t.rstrip('s')))
+    )
+
+
+def branch_tree(repo):
+    try:
+        ref = repo.lookup_reference('refs/heads/git-annex')
+    except KeyError:
+        return None
+    return ref.peel(pygit2.Commit).tree
+
+
+def walk_logs(repo, tree):
+    for path, oid in walk_tree(repo, tree):
+        if path.endswith(log_suffix):
+            yield path, oid
+
+
+def changed_logs(repo, old_tree, new_tree):
+    if old_tree is None:
+        yield from walk_logs(repo, new_tree)
+        return
+
+    for patch in repo.diff(old_tree, new_tree):
+        delta = patch.delta
+        if delta.new_file.path.endswith(log_suffix):
+            if delta.status == pygit2.GIT_DELTA_DELETED:
+                yield delta.new_file.path, None
+            else:
+                yield delta.new_file.path, delta.new_file.id
+
+
+def journal_logs(repo):
+    journal = os.path.join(repo.path, 'annex', 'journal')
+    try:
+        names = os.listdir(journal)
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        if name.endswith(log_suffix):
+            with open(os.path.join(journal, name)) as file:
+                yield name, file.read()
+
+
+def read_key_logs(repo, keys):
+    """
+    Yields (key, fields) for each of the given keys, preferring the
+    journalled log over the one on the git-annex branch.
+    """
+    tree = branch_tree(repo)
+    journal = os.path.join(repo.path, 'annex', 'journal')
+    try:
+        journalled = set(os.listdir(journal))
+    except FileNotFoundError:
+        journalled = set()
+
+    for key in keys:
+        path = key_log_path(key)
+        text = None
+
+        if journal_path(path) in journalled:
+            with open(os.path.join(journal, journal_path(path))) as file:
+                text = file.read()
+        elif tree is not None and path in tree:
+            text = repo[tree[path].id].data.decode()
+
+        yield key, parse_log(text) if text else {}
+
+
+def read_logs(repo, old_tree=None):
+    """
+    Yields (key, fields) for every key whose metadata log changed on the
+    git-annex branch since old_tree, then for every journalled log.
+    fields is None if the log was deleted.
+    """
+    new_tree = branch_tree(repo)
+    if new_tree is not None:
+        for path, oid in changed_logs(repo, old_tree, new_tree):
+            text = repo[oid].data.decode() if oid else None
+            yield key_from_path(path), parse_log(text) if text else None
+
+    for name, text in journal_logs(repo):
+        yield key_from_path(journal_unmangle(name)), parse_log(text)
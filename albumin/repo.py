@@ -15,20 +15,51 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
+import stat
+import zlib
+import fcntl
+import hashlib
+from contextlib import contextmanager
 from datetime import datetime
 from datetime import tzinfo
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
 import pytz
 import pygit2
 
 from git_annex_adapter import GitAnnex
 from git_annex_adapter import GitAnnexMetadata
 from albumin.imdate import analyze_date
+from albumin.imdate import get_timezone
 from albumin.imdate import ImageDate
 from albumin.imdate import Report
 from albumin.utils import files_in
+from albumin.utils import in_shard
+from albumin.utils import place_file
+from albumin.utils import walk_tree
+from albumin import metalog
+from albumin.journal import ImportJournal
+from albumin.keycache import KeyCache
+from albumin.journal import dump_imdate
+from albumin.journal import load_imdate
+from albumin.batch import annex_batch
+from albumin.diskorder import disk_order
+from albumin.archive import is_archive
+from albumin.archive import archive_heads
+from albumin.archive import read_archive
+from albumin.archive import renamed_report
+from albumin.batch import chunks
+from albumin.batch import run
+
+arranged_name = re.compile(r'(\d{8}T\d{6}Z)\d\d(\.[^/]*)?$')
 
 
 class AlbuminRepo(pygit2.Repository):
+    report_trailer = 'Albumin-Report: '
+    report_notes = 'refs/notes/albumin'
+
     @staticmethod
     def config_overrides():
         try:
@@ -53,6 +84,9 @@ class AlbuminRepo(pygit2.Repository):
         self.annex = AlbuminAnnex(self.workdir, create=create)
 
         self._session_timezone = None
+        self._key_cache = None
+        self._lock_file = None
+        self._lock_depth = 0
 
     def get_config(self, key):
         value = self.config[key] if key in self.config else None
@@ -64,86 +98,434 @@ class AlbuminRepo(pygit2.Repository):
         if self._session_timezone:
             return self._session_timezone
         tz = self.get_config('albumin.timezone')
-        return pytz.timezone(tz) if tz else tz
+        return get_timezone(tz) if tz else tz
 
     @timezone.setter
     def timezone(self, tz):
         if isinstance(tz, str):
-            tz = pytz.timezone(tz)
+            tz = get_timezone(tz)
         self._session_timezone = tz
 
-    def import_(self, path, mtime=False, **tags):
-        files = self.annex.import_(path)
-        report = self.imdate_diff(
-            files={self.abs_path(f): k for f, k in files.items()},
-            mtime=mtime,
-        )
+    @property
+    def jobs(self):
+        jobs = self.get_config('albumin.jobs')
+        return int(jobs) if jobs else None
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Holds the repo-wide albumin lock while changing the index, HEAD,
+        the work tree or metadata, so concurrent albumin processes take
+        turns at it. It can be taken again while already held.
+        """
+        if not self._lock_depth:
+            path = os.path.join(self.path, 'albumin', 'write.lock')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._lock_file = open(path, 'w')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if not self._lock_depth:
+                self._lock_file.close()
+                self._lock_file = None
 
-        if report.remaining:
-            raise NotImplementedError(report.remaining)
+    @property
+    def annex_backend(self):
+        backend = self.get_config('annex.backend') \
+            or self.get_config('annex.backends') or 'SHA256E'
+        return backend.split()[0]
 
-        for _, (key, new_imdate) in report.additions.items():
-            self.annex[key].imdate = new_imdate
-        for _, (key, new_imdate, _) in report.overwrites.items():
-            self.annex[key].imdate = new_imdate
-        for _, key in report.files.items():
-            self.annex[key].update(tags)
+    @property
+    def layout(self):
+        return self.get_config('albumin.layout') or ''
+
+    def layout_dir(self, utc):
+        return utc.strftime(self.layout) if self.layout else ''
 
-        self.arrange_by_imdates(files=files)
-        return report
+    @property
+    def report_blobs(self):
+        value = self.get_config('albumin.report-blob') or ''
+        return value.lower() in ('true', 'yes', 'on', '1')
 
-    def analyze(self, path=None, mtime=False):
-        files = {f: self.annex.calckey(f) for f in files_in(path)}
+    @property
+    def key_cache(self):
+        if self._key_cache is None:
+            self._key_cache = KeyCache(self)
+        return self._key_cache
+
+    def calckeys(self, paths):
+        keys, misses = OrderedDict(), {}
+        backend = self.annex_backend
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            keys[path] = self.key_cache.get(path, st, backend) \
+                if st else None
+            if not keys[path]:
+                misses[path] = st
+
+        calculated = run(annex_batch(
+            'calckey', self.workdir, disk_order(misses), self.jobs,
+            readahead=True,
+        ))
+        for path, key in calculated.items():
+            keys[path] = key
+            if key and misses[path]:
+                self.key_cache.put(path, key, misses[path])
+        self.key_cache.commit()
+
+        return keys
+
+    def file_key(self, path):
+        abs_path = self.abs_path(path)
+        st = os.lstat(abs_path)
+        if stat.S_ISLNK(st.st_mode):
+            return os.path.basename(os.readlink(abs_path))
+
+        key = self.key_cache.get(abs_path, st)
+        if not key:
+            key = self.annex.lookupkey(path)
+            if key:
+                self.key_cache.put(abs_path, key, st)
+        return key
+
+    def lookupkeys(self, files):
+        return run(annex_batch('lookupkey', self.workdir, files, self.jobs))
+
+    def annex_import(self, path, keep=False, files=None):
+        """
+        Like git annex import, but puts each file into the work tree
+        with utils.place_file before annexing it, to avoid copying file
+        contents when possible. Returns the keys of the imported files,
+        and how each was placed along with the bytes that took.
+
+        If files are given, only those files under path are imported,
+        and emptied folders in path are left in place.
+        """
+        path = path.rstrip('/')
+        prefix = self.import_prefix(path)
+
+        if is_archive(path):
+            placed = self.extract_archive(path, prefix)
+            return self.lookupkeys(placed), placed
+
+        placed = OrderedDict()
+        for src in files_in(path) if files is None else files:
+            file = os.path.join(prefix, os.path.relpath(src, path))
+            if os.path.lexists(self.abs_path(file)):
+                continue
+            size = os.path.getsize(src)
+            strategy = place_file(src, self.abs_path(file), keep=keep)
+            written = size if strategy.startswith('copy') else 0
+            placed[file] = (strategy, written)
+
+        with self.write_lock():
+            for chunk in chunks(placed, 1000):
+                self.annex._annex('add', *chunk)
+
+        if not keep and files is None:
+            for root, dirs, _ in os.walk(path, topdown=False):
+                for dir_ in dirs:
+                    try:
+                        os.rmdir(os.path.join(root, dir_))
+                    except OSError:
+                        pass
+
+        return self.lookupkeys(placed), placed
+
+    def extract_archive(self, path, prefix):
+        """
+        Writes the files in the archive under prefix and annexes them,
+        reading the archive once. Files already there from an earlier
+        attempt are skipped, and those whose content HEAD already has
+        are removed right after they are written and not annexed. The
+        archive itself is left in place.
+        """
+        placed = OrderedDict()
+        dest = self.abs_path(prefix)
+        existing = set(map(os.path.normpath, files_in(dest, relative=dest)))
+        for name, key, _, _ in read_archive(
+            path, backend=self.annex_backend, head_size=0, dest=dest,
+            skip=existing,
+        ):
+            file = os.path.join(prefix, name)
+            placed[file] = (key, os.path.getsize(self.abs_path(file)))
+
+        # The backend can't be hashed while reading, ask git-annex
+        missing = [file for file, (key, _) in placed.items() if not key]
+        if missing:
+            keys = self.calckeys(map(self.abs_path, missing))
+            for file in missing:
+                placed[file] = (keys[self.abs_path(file)], placed[file][1])
+
+        known = self.head_keys()
+        for file, (key, _) in list(placed.items()):
+            if key in known:
+                os.remove(self.abs_path(file))
+                del placed[file]
+
+        with self.write_lock():
+            for chunk in chunks(placed, 1000):
+                self.annex._annex('add', *chunk)
+
+        return OrderedDict(
+            (file, ('extract', size)) for file, (_, size) in placed.items()
+        )
+
+    @staticmethod
+    def import_prefix(path):
+        """
+        The folder files from path are staged in while being imported,
+        named after path but distinct for each source.
+        """
+        path = os.path.abspath(path).rstrip('/')
+        digest = hashlib.md5(path.encode(errors='surrogateescape'))
+        return '{}-{}'.format(os.path.basename(path), digest.hexdigest()[:8])
+
+    def import_journaled(self, path, commit_msg, mtime=False,
+                         chunk_size=1000, keep=False, files=None, **tags):
+        """
+        Imports files from path in chunks of chunk_size, committing each
+        chunk separately and recording progress in an ImportJournal.
+        Calling this again for the same path resumes an interrupted
+        import. Returns the files left staged because they had no date,
+        and how the files were placed (see annex_import).
+
+        Imports of different paths can run at the same time: they only
+        take the write lock to annex, write metadata and commit, and
+        analyze files while the others do so.
+
+        If files are given, only those are imported from path, and files
+        left pending by earlier imports are not analyzed again.
+        """
+        journal = ImportJournal(self, path, retry=files is None)
+
+        prefix = self.import_prefix(path) + '/'
+        with self.write_lock():
+            # Files moved here by a run that stopped before journaling
+            # them are only in the prefix now, so annex them all again.
+            if os.path.isdir(self.abs_path(prefix)):
+                self.annex._annex('add', prefix)
+            staged = {
+                f: k for f, k in self.new_files().items()
+                if f.startswith(prefix) and f not in journal.files
+            }
+        placed = {}
+        if os.path.isdir(path) or is_archive(path):
+            imported, placed = self.annex_import(
+                path, keep=keep, files=files,
+            )
+            staged.update(imported)
+        for file, key in staged.items():
+            strategy, _ = placed.get(file, (None, 0))
+            journal.record(file, 'keyed', key=key, strategy=strategy)
+        journal.checkpoint()
+
+        todo = list(journal.at('keyed', 'dated', 'metadata'))
+        for chunk in chunks(todo, chunk_size):
+            self._import_chunk(journal, chunk, commit_msg, mtime, tags)
+
+        journal.finish()
+        pending = {f: e['key'] for f, e in journal.pending.items()}
+        return pending, placed
+
+    def _import_chunk(self, journal, chunk, commit_msg, mtime, tags):
+        def at(stage):
+            return OrderedDict(
+                (f, journal.files[f]) for f in chunk
+                if journal.files[f]['stage'] == stage
+            )
+
+        keyed = {self.abs_path(f): e['key'] for f, e in at('keyed').items()}
+        if keyed:
+            report = self.imdate_diff(files=keyed, mtime=mtime)
+            updates = report.updates
+            for file, key in keyed.items():
+                if file in report.remaining:
+                    journal.record(self.rel_path(file), 'pending', key=key)
+                    continue
+                new, old = updates.get(key, (None, None))
+                journal.record(
+                    self.rel_path(file), 'dated', key=key,
+                    new=dump_imdate(new), old=dump_imdate(old),
+                )
+            journal.checkpoint()
+
+        with self.write_lock():
+            self._write_chunk(journal, at, commit_msg, tags)
+
+    def _write_chunk(self, journal, at, commit_msg, tags):
+        dated = at('dated')
+        stored = self.stored_imdates({e['key'] for e in dated.values()})
+        for file, entry in dated.items():
+            new = load_imdate(entry['new'])
+            old = stored.get(entry['key'])
+            if new and (old is None or not new < old):
+                self.annex[entry['key']].imdate = new
+            self.annex[entry['key']].update(tags)
+            journal.record(file, 'metadata')
+        journal.checkpoint()
+
+        arranged = at('metadata')
+        if not arranged:
+            return
+
+        # Files of a run that stopped after committing them are still at
+        # this stage, but already at the dest they were planned to.
+        done = self.resume_arranged({
+            f: (e['key'], e.get('dest')) for f, e in arranged.items()
+        })
+        for file in done:
+            journal.record(file, 'arranged')
+        journal.checkpoint()
+        arranged = OrderedDict(
+            (f, e) for f, e in arranged.items() if f not in done
+        )
+        if not arranged:
+            return
+
+        files = {f: e['key'] for f, e in arranged.items()}
+        moves = self.plan_names(files, self.head_tree())
+        for file, dest in moves.items():
+            journal.record(file, 'metadata', dest=dest)
+        journal.checkpoint()
+
+        report = Report(
+            {self.abs_path(f): e['key'] for f, e in arranged.items()},
+            {
+                e['key']: (load_imdate(e['new']), load_imdate(e['old']))
+                for e in arranged.values() if e['new']
+            },
+            set(),
+        )
+
+        self.commit_arranged(files, commit_msg(report), moves=moves)
+        for file in arranged:
+            journal.record(file, 'arranged')
+        journal.checkpoint()
+
+    def analyze(self, path=None, mtime=False, shard=None):
+        if is_archive(path):
+            with archive_heads(path, backend=self.annex_backend) as heads:
+                files = OrderedDict(
+                    (head, key) for head, (name, key) in heads.items()
+                    if in_shard(name, shard)
+                )
+                # Whole files, for backends that can't be hashed here
+                missing = [head for head, key in files.items() if not key]
+                if missing:
+                    files.update(run(annex_batch(
+                        'calckey', self.workdir, missing, self.jobs,
+                    )))
+                report = self.imdate_diff(files, mtime=mtime)
+                return renamed_report(report, {
+                    head: os.path.join(path, name)
+                    for head, (name, _) in heads.items()
+                })
+
+        if path:
+            files = self.calckeys(
+                file for file in files_in(path)
+                if in_shard(os.path.relpath(file, path), shard)
+            )
+        else:
+            files = {
+                self.abs_path(f): k for f, k in self.new_files().items()
+                if in_shard(f, shard)
+            }
         return self.imdate_diff(files, mtime=mtime)
 
     def imdate_diff(self, files=None, mtime=False):
-        if not files:
+        if files is None:
             files = self.new_files()
             files = {self.abs_path(f): k for f, k in files.items()}
 
+        # Files whose key couldn't be computed can't have metadata, and
+        # are left remaining even if they have a date.
+        keyless = {file for file, key in files.items() if key is None}
+
         timezone = self.timezone
         report = analyze_date(*files, timezone=timezone, mtime=mtime)
+        stored = self.stored_imdates(set(files.values()) - {None})
 
         for file in report.remaining:
             key = files[file]
-            meta = self.annex.get(key, None)
-            if meta and meta.imdate:
+            if stored.get(key):
                 report.redundants[file] = key
 
         def conflicts(a, b):
             return a.method == b.method and a.datetime != b.datetime
 
-        key_data = {}
-        for file, (_, imdate) in report.additions.items():
-            key = files[file]
-            imdate_ = key_data.get(key, imdate)
-            if conflicts(imdate, imdate_):
-                raise RuntimeError(file, imdate, imdate_)
-            key_data[key] = max(imdate, imdate_)
+        rows = sorted(
+            ((files[file], imdate)
+             for file, (_, imdate) in report.additions.items()
+             if file not in keyless),
+            key=itemgetter(0),
+        )
 
         updates = {}
-        for key, new in key_data.items():
-            try:
-                old = self.annex.get(key).imdate
-                if not new.timezone:
-                    new.timezone = old.timezone
-            except:
-                old = None
+        for key, group in groupby(rows, key=itemgetter(0)):
+            imdates = [imdate for _, imdate in group]
+            new = max(imdates)
+            for imdate in imdates:
+                if conflicts(imdate, new):
+                    raise RuntimeError(key, imdate, new)
+
+            old = stored.get(key)
+            if old and not new.timezone:
+                new.timezone = old.timezone
 
             if (new > old) \
                     or (new == old and new.datetime != old.datetime) \
                     or (new.timezone != old.timezone):
                 updates[key] = (max(new, old), old)
 
-        return Report(files, updates, report.remaining)
+        return Report(files, updates, set(report.remaining) | keyless)
+
+    def merge_annex(self):
+        """
+        Merges remote git-annex branches into the local one if any of
+        them has something it doesn't, like git-annex does before it
+        reads the branch.
+        """
+        local = self.references.get('refs/heads/git-annex')
+        for name in self.references:
+            if not name.startswith('refs/remotes/') \
+                    or not name.endswith('/git-annex'):
+                continue
+            target = self.references[name].target
+            if local is None or not (
+                target == local.target
+                or self.descendant_of(local.target, target)
+            ):
+                self.annex._annex('merge')
+                return
+
+    def stored_imdates(self, keys):
+        """
+        Reads the imdates of many keys at once from the git-annex branch,
+        instead of asking git-annex for each key's metadata separately.
+        Remote git-annex branches are merged into it first.
+        """
+        self.merge_annex()
+        return {
+            key: AlbuminMetadata.parse_imdate(fields)
+            for key, fields in metalog.read_key_logs(self, keys)
+        }
 
     def apply_report(self, report, **tags):
-        for _, (key, new_imdate) in report.additions.items():
-            self.annex[key].imdate = new_imdate
-        for _, (key, new_imdate, _) in report.overwrites.items():
-            self.annex[key].imdate = new_imdate
-        for _, key in report.files.items():
-            self.annex[key].update(tags)
+        with self.write_lock():
+            for _, (key, new_imdate) in report.additions.items():
+                self.annex[key].imdate = new_imdate
+            for _, (key, new_imdate, _) in report.overwrites.items():
+                self.annex[key].imdate = new_imdate
+            for _, key in report.files.items():
+                self.annex[key].update(tags)
 
     def new_files(self, keys=True):
         self.index.read()
@@ -158,28 +540,45 @@ class AlbuminRepo(pygit2.Repository):
             )
 
         if keys:
-            return {file: self.annex.lookupkey(file) for file in files}
+            return self.lookupkeys(files)
         else:
             return files
 
+    def head_keys(self):
+        """
+        The keys of the annexed files in HEAD.
+        """
+        try:
+            tree = self.head.peel(pygit2.Commit).tree
+        except pygit2.GitError:
+            return set()
+
+        keys = set()
+        for _, oid in walk_tree(self, tree):
+            blob = self[oid]
+            if blob.size > 1024:
+                continue
+            target = blob.data.decode(errors='replace').strip()
+            if '/annex/objects/' in target:
+                keys.add(target.split('/')[-1])
+        return keys
+
     def index_move(self, src, dst):
         idx = self.index[src]
         self.index.remove(src)
         idx.path = dst
         self.index.add(idx)
 
-    def arrange_by_imdates(self, files=None, imdates=None):
-        if not imdates:
-            imdates = {}
-
-        def datetime_name(file, key):
-            imdate = imdates.get(key, self.annex[key].imdate)
-            if not imdate:
-                return None
-            utc = imdate.datetime.astimezone(pytz.utc)
-            ext = os.path.splitext(file)[1]
-            return '{:%Y%m%dT%H%M%SZ}{{:02}}{}'.format(utc, ext)
+    def datetime_name(self, file, key, imdates=None):
+        imdate = (imdates or {}).get(key) or self.annex[key].imdate
+        if not imdate:
+            return None
+        utc = imdate.datetime.astimezone(pytz.utc)
+        ext = os.path.splitext(file)[1]
+        name = '{:%Y%m%dT%H%M%SZ}{{:02}}{}'.format(utc, ext)
+        return os.path.join(self.layout_dir(utc), name)
 
+    def arrange_by_imdates(self, files=None, imdates=None):
         def move_file(file, key, dest):
             if dest in self.index:
                 try:
@@ -191,21 +590,24 @@ class AlbuminRepo(pygit2.Repository):
                 except:
                     pass
 
-            elif not os.path.exists(self.abs_path(dest)):
-                self.index_move(file, dest)
-                return dest
+            else:
+                try:
+                    dest_key = self.file_key(dest)
+                except FileNotFoundError:
+                    self.index_move(file, dest)
+                    return dest
 
-            elif self.annex.lookupkey(dest) == key:
-                self.index.remove(file)
-                return dest
+                if dest_key == key:
+                    self.index.remove(file)
+                    return dest
 
         if not files:
             files = self.new_files()
-        moved_files = []
+        moved_files = {}
 
         self.index.read()
         for file, key in files.items():
-            name_fmt = datetime_name(file, key)
+            name_fmt = self.datetime_name(file, key, imdates)
             if not name_fmt:
                 continue
 
@@ -215,39 +617,330 @@ class AlbuminRepo(pygit2.Repository):
                 if file == dest:
                     break
                 elif move_file(file, key, dest):
-                    moved_files.append(file)
+                    moved_files[file] = dest
                     break
             else:
                 err_msg = 'Ran out of {} files'
                 raise RuntimeError(err_msg.format(name_fmt))
         self.index.write()
 
-        for file in moved_files:
-            os.remove(self.abs_path(file))
+        self.update_workdir(moved_files)
 
-        for folder in set(map(os.path.dirname, files)):
+    def plan_names(self, files, tree=None):
+        def tree_key(path):
+            try:
+                entry = tree[path]
+            except (KeyError, TypeError):
+                return None
+            return self[entry.id].data.decode().split('/')[-1]
+
+        taken = {}
+        moves = {}
+        for file, key in files.items():
+            name_fmt = self.datetime_name(file, key)
+            if not name_fmt:
+                moves[file] = file
+                continue
+
+            for i in range(0, 100):
+                dest = name_fmt.format(i)
+                owner = taken.get(dest) or tree_key(dest)
+                if owner is None or owner == key:
+                    taken[dest] = key
+                    moves[file] = dest
+                    break
+            else:
+                err_msg = 'Ran out of {} files'
+                raise RuntimeError(err_msg.format(name_fmt))
+
+        return moves
+
+    def relink(self, oid, mode, src, dest):
+        if mode != pygit2.GIT_FILEMODE_LINK:
+            return oid
+
+        target = self[oid].data.decode()
+        target = os.path.join(os.path.dirname(src), target)
+        target = os.path.normpath(target)
+        target = os.path.relpath(target, os.path.dirname(dest) or '.')
+        return self.create_blob(target.encode())
+
+    def tree_with(self, tree, entries):
+        """
+        Writes a copy of the tree with the given {path: (oid, mode)}
+        entries added, or removed where they are None. Only the subtrees
+        containing the paths are rebuilt, and emptied ones are dropped.
+        """
+        builder = self.TreeBuilder(tree) if tree else self.TreeBuilder()
+
+        subdirs = {}
+        for path, entry in entries.items():
+            name, sep, rest = path.partition('/')
+            if sep:
+                subdirs.setdefault(name, {})[rest] = entry
+            elif entry is None:
+                if builder.get(name) is not None:
+                    builder.remove(name)
+            else:
+                builder.insert(name, *entry)
+
+        for name, sub_entries in subdirs.items():
+            subtree = tree[name] if tree and name in tree else None
+            subtree = self[subtree.id] if subtree else None
+            oid = self.tree_with(subtree, sub_entries)
+            if len(self[oid]):
+                builder.insert(name, oid, pygit2.GIT_FILEMODE_TREE)
+            elif builder.get(name) is not None:
+                builder.remove(name)
+
+        return builder.write()
+
+    def head_tree(self):
+        try:
+            return self.head.peel(pygit2.Commit).tree
+        except pygit2.GitError:
+            return None
+
+    def commit_arranged(self, files, message, moves=None):
+        """
+        Commits the given staged files under their imdate names, on top
+        of HEAD, by building the new tree directly rather than moving
+        index entries and re-reading the working tree. The moves can be
+        given if they were already planned with plan_names.
+        """
+        tree = self.head_tree()
+        self.index.read()
+        if moves is None:
+            moves = self.plan_names(files, tree)
+
+        entries = {}
+        for file, dest in moves.items():
+            entry = self.index[file]
+            oid = self.relink(entry.id, entry.mode, file, dest)
+            entries[dest] = (oid, entry.mode)
+
+        commit = self.commit(message, tree=self.tree_with(tree, entries))
+
+        for file, dest in moves.items():
+            self.index.remove(file)
+        for dest, (oid, mode) in entries.items():
+            self.index.add(pygit2.IndexEntry(dest, oid, mode))
+        self.index.write()
+
+        self.update_workdir({
+            file: dest for file, dest in moves.items() if file != dest
+        }, pre_commit=False)
+        return commit
+
+    def resume_arranged(self, files):
+        """
+        Takes {file: (key, dest)} planned by a commit_arranged that may
+        have been interrupted, and finishes moving the files whose dest
+        already holds their key in HEAD, i.e. that were committed.
+        Returns the moves of those files.
+        """
+        tree = self.head_tree()
+        if tree is None:
+            return {}
+
+        self.index.read()
+        moves = {}
+        for file, (key, dest) in files.items():
+            try:
+                entry = tree[dest] if dest else None
+            except KeyError:
+                entry = None
+            if entry is None \
+                    or self[entry.id].data.decode().split('/')[-1] != key:
+                continue
+            if file in self.index:
+                self.index.remove(file)
+            self.index.add(pygit2.IndexEntry(dest, entry.id, entry.filemode))
+            moves[file] = dest
+        self.index.write()
+
+        self.update_workdir({
+            file: dest for file, dest in moves.items() if file != dest
+        }, pre_commit=False)
+        return moves
+
+    def relayout(self):
+        """
+        Moves every arranged file in HEAD to the directory albumin.layout
+        gives for its name, in one commit, and returns the moves. The
+        dates are read from the names, so no metadata is read.
+        """
+        with self.write_lock():
+            tree = self.head.peel(pygit2.Commit).tree
+            self.index.read()
+
+            moves = {}
+            for path, oid in walk_tree(self, tree):
+                match = arranged_name.match(os.path.basename(path))
+                if not match:
+                    continue
+                utc = datetime.strptime(match.group(1), '%Y%m%dT%H%M%SZ')
+                dest = os.path.join(self.layout_dir(utc), match.group(0))
+                if dest != path:
+                    moves[path] = dest
+
+            entries = {}
+            for file, dest in moves.items():
+                taken = entries.get(dest) is not None
+                if taken or (dest not in moves and dest in tree):
+                    raise RuntimeError(file, dest)
+                entry = tree[file]
+                oid = self.relink(entry.id, entry.filemode, file, dest)
+                entries[file] = entries.get(file)
+                entries[dest] = (oid, entry.filemode)
+
+            if not moves:
+                return moves
+            self.commit(
+                'Move files to layout {}'.format(self.layout or '(flat)'),
+                tree=self.tree_with(tree, entries),
+            )
+
+            for file in moves:
+                if file in self.index:
+                    self.index.remove(file)
+            for dest, entry in entries.items():
+                if entry is not None:
+                    self.index.add(pygit2.IndexEntry(dest, *entry))
+            self.index.write()
+
+            self.update_workdir(moves, pre_commit=False)
+            return moves
+
+    def update_workdir(self, moves, pre_commit=True):
+        if not moves:
+            return
+
+        # Sources missing from the work tree are only in the index, and
+        # their destinations are checked out all the same.
+        for file in moves:
+            try:
+                os.remove(self.abs_path(file))
+            except FileNotFoundError:
+                pass
+
+        for folder in set(map(os.path.dirname, moves)):
             try:
                 os.removedirs(self.abs_path(folder))
             except OSError:
                 pass
 
-        self.checkout_index()
-        self.annex.pre_commit()
-        self.index.read()
+        dests = sorted(set(moves.values()))
+        self.checkout_index(paths=dests)
+        if pre_commit:
+            for paths in chunks(dests, 1000):
+                self.annex._annex('pre-commit', *paths)
+            self.index.read()
 
     def fix_filenames(self, files=None):
-        if not files:
-            self.index.read()
-            files = (i.path for i in self.index)
-        files = {f: self.annex.lookupkey(f) for f in files}
-        self.arrange_by_imdates(files)
+        with self.write_lock():
+            if not files:
+                self.index.read()
+                files = (i.path for i in self.index)
+            files = self.lookupkeys(files)
+            self.arrange_by_imdates(files)
 
-        diff = self.diff('HEAD', cached=True)
-        if len(diff) > 0:
-            self.commit('Fix filenames')
+            diff = self.diff('HEAD', cached=True)
+            if len(diff) > 0:
+                self.commit('Fix filenames')
         return diff.stats.format(pygit2.GIT_DIFF_STATS_FULL, 80)
 
-    def commit(self, message, timestamp=None):
+    def compact_metadata(self):
+        """
+        Rewrites every metadata log on the git-annex branch to only the
+        last change of each value, in one commit. Returns the number of
+        rewritten logs, and the total size of all logs before and after.
+        """
+        with self.write_lock():
+            self.annex._annex('merge')
+            ref = self.lookup_reference('refs/heads/git-annex')
+            parent = ref.peel(pygit2.Commit)
+
+            entries, before, after = {}, 0, 0
+            for path, oid in metalog.walk_logs(self, parent.tree):
+                data = self[oid].data
+                compacted = metalog.compact_log(data.decode()).encode()
+                before, after = before + len(data), after + len(compacted)
+                if compacted != data:
+                    blob = self.create_blob(compacted)
+                    entries[path] = (blob, pygit2.GIT_FILEMODE_BLOB)
+
+            if entries:
+                self.create_commit(
+                    ref.name, self.default_signature, self.default_signature,
+                    'compact metadata', self.tree_with(parent.tree, entries),
+                    [parent.id],
+                )
+                try:
+                    os.remove(os.path.join(self.path, 'annex', 'index'))
+                except FileNotFoundError:
+                    pass
+
+            return len(entries), before, after
+
+    def report_section(self, report):
+        """
+        Returns the commit message lines for the report: a [report]
+        section, or if albumin.report-blob is set, a trailer naming a
+        blob of the compressed report.
+        """
+        if not self.report_blobs:
+            return ['[report]', *report.short()]
+
+        data = '\n'.join(report.short()).encode()
+        blob = self.create_blob(zlib.compress(data, 9))
+        return [self.report_trailer + str(blob)]
+
+    def report_blob(self, message):
+        for line in message.splitlines():
+            if line.startswith(self.report_trailer):
+                return line[len(self.report_trailer):].strip()
+        return None
+
+    def load_report(self, blob):
+        try:
+            data = zlib.decompress(self[blob].data).decode()
+        except (KeyError, ValueError, zlib.error):
+            msg = 'Report blob {} is missing, try fetching {}.'
+            raise ValueError(msg.format(blob, self.report_notes)) from None
+        return Report.parse(data.splitlines())
+
+    def keep_report(self, commit, message):
+        """
+        Adds the report blob named in the commit message to the notes
+        of the commit, so that it stays reachable.
+        """
+        blob = self.report_blob(message)
+        if blob is None:
+            return
+
+        try:
+            parent = self.lookup_reference(self.report_notes)
+            parent = parent.peel(pygit2.Commit)
+        except (KeyError, ValueError):
+            parent = None
+
+        if parent:
+            builder = self.TreeBuilder(parent.tree)
+        else:
+            builder = self.TreeBuilder()
+        builder.insert(
+            str(commit), pygit2.Oid(hex=blob), pygit2.GIT_FILEMODE_BLOB
+        )
+
+        self.create_commit(
+            self.report_notes,
+            self.default_signature, self.default_signature,
+            'Notes added by albumin', builder.write(),
+            [parent.id] if parent else [],
+        )
+
+    def commit(self, message, timestamp=None, tree=None):
         if not timestamp:
             timestamp = datetime.now(pytz.utc)
 
@@ -264,10 +957,13 @@ class AlbuminRepo(pygit2.Repository):
         else:
             parents = [self.head.get_object().hex]
 
+        if not tree:
+            tree = self.index.write_tree()
+
         commit = self.create_commit(
-            'HEAD', author, author, message,
-            self.index.write_tree(), parents
+            'HEAD', author, author, message, tree, parents
         )
+        self.keep_report(commit, message)
 
         return commit
 
@@ -307,12 +1003,40 @@ class AlbuminAnnex(GitAnnex):
 
 
 class AlbuminMetadata(GitAnnexMetadata):
+    """
+    Metadata of a key, with its fields parsed into datetimes and
+    timezones. Parsed fields are kept on the object until it is changed.
+    AlbuminAnnex gives a new object on each lookup, so keep one around
+    to read several fields of a key.
+    """
+    missing = object()
+
     def __init__(self, annex, key, file=None):
         super().__init__(annex, key, file=file)
+        self._parsed = {}
 
     @classmethod
     def make_parsed(cls, metadata):
         metadata.__class__ = cls
+        metadata._parsed = {}
+
+    @staticmethod
+    def parse_imdate(fields):
+        try:
+            dt_naive = datetime.strptime(
+                fields['datetime'][0], '%Y-%m-%d@%H-%M-%S'
+            )
+            method = fields['datetime-method'][0]
+        except (KeyError, IndexError, ValueError):
+            return None
+
+        timezone = fields.get('timezone')
+        timezone = get_timezone(timezone[0]) if timezone else pytz.utc
+        dt = pytz.utc.localize(dt_naive).astimezone(timezone)
+        try:
+            return ImageDate(method, dt)
+        except ValueError:
+            return None
 
     @property
     def imdate(self):
@@ -335,10 +1059,20 @@ class AlbuminMetadata(GitAnnexMetadata):
                 self['timezone'] = new.timezone
 
     def __getitem__(self, meta_key):
+        value = self._parsed.get(meta_key)
+        if value is None:
+            value = self._parse(meta_key)
+            self._parsed[meta_key] = value
+
+        if value is self.missing:
+            raise KeyError(meta_key)
+        return value
+
+    def _parse(self, meta_key):
         try:
             value = super().__getitem__(meta_key)[0]
-        except IndexError:
-            raise KeyError(meta_key)
+        except (KeyError, IndexError):
+            return self.missing
 
         if meta_key == 'datetime':
             dt_naive = datetime.strptime(value, '%Y-%m-%d@%H-%M-%S')
@@ -351,11 +1085,13 @@ class AlbuminMetadata(GitAnnexMetadata):
             value = pytz.utc.localize(dt_naive)
 
         elif meta_key == 'timezone':
-            value = pytz.timezone(value)
+            value = get_timezone(value)
 
         return value
 
     def __setitem__(self, meta_key, value):
+        self._parsed.clear()
+
         if isinstance(value, datetime):
             value_utc = value.astimezone(pytz.utc)
             value = value_utc.strftime('%Y-%m-%d@%H-%M-%S')
@@ -371,6 +1107,10 @@ class AlbuminMetadata(GitAnnexMetadata):
 
         super().__setitem__(meta_key, [value])
 
+    def __delitem__(self, meta_key):
+        self._parsed.clear()
+        super().__delitem__(meta_key)
+
     def __repr__(self):
         repr_ = 'AlbuminMetadata(key={!r}, file={!r})'
         return repr_.format(self.key, self.file)
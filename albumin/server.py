@@ -0,0 +1,206 @@
+# Albumin Server
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import io
+import sys
+import json
+import array
+import socket
+import traceback
+import contextlib
+
+import albumin.hooks
+
+
+def socket_path(git_dir):
+    return os.path.join(git_dir, 'albumin', 'serve.sock')
+
+
+def find_git_dir(path):
+    """
+    The git dir of the repo that path is in, found the way git does it
+    but without running git, or None if path isn't in a repo.
+    """
+    if os.environ.get('GIT_DIR'):
+        return os.path.abspath(os.environ['GIT_DIR'])
+
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            with open(dot_git) as file:
+                line = file.readline().strip()
+            if not line.startswith('gitdir: '):
+                return None
+            return os.path.join(path, line[len('gitdir: '):])
+        if os.path.isfile(os.path.join(path, 'HEAD')) \
+                and os.path.isdir(os.path.join(path, 'objects')):
+            return path
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def send_fds(conn, fds):
+    fds = array.array('i', fds)
+    conn.sendmsg([b'\0'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+
+def receive_fds(conn, count):
+    fds = array.array('i')
+    _, ancdata, _, _ = conn.recvmsg(1, socket.CMSG_LEN(count * fds.itemsize))
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return list(fds)
+
+
+def forward(argv, args):
+    """
+    Send a command to the repo's albumin server, if there is one.
+    Returns the command's exit status, or None if it must run locally.
+    """
+    local = ['init', 'uninit', 'serve', 'watch', 'export']
+    if any(args.get(cmd) for cmd in local):
+        return None
+
+    git_dir = find_git_dir(args.get('--repo') or '.')
+    if git_dir is None:
+        return None
+
+    path = socket_path(git_dir)
+    if not os.path.exists(path):
+        return None
+
+    stdin = None
+    if args.get('apply') and not args.get('<path>'):
+        stdin = sys.stdin.read()
+
+    request = {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': git_environ(),
+        'stdin': stdin,
+    }
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+
+        # The server writes to our stdout and stderr itself, and so do
+        # the processes it runs for the command.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        send_fds(conn, [1, 2])
+        conn.sendall(json.dumps(request).encode() + b'\n')
+        line = conn.makefile('rb').readline()
+
+    if not line:
+        return 1
+    return json.loads(line.decode())['retval']
+
+
+def git_environ():
+    return {k: v for k, v in os.environ.items() if k.startswith('GIT_')}
+
+
+def serve(repo, run):
+    """
+    Keep the repo, its git-annex processes and a set of warm batch
+    processes open, and run the requests sent by forward() with them.
+    """
+    import albumin.batch
+
+    path = socket_path(repo.path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+
+    albumin.batch.keep_warm()
+    albumin.hooks.resident_repo = repo
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print('Serving {} at {}'.format(repo.workdir, path))
+
+    def handle(conn):
+        fds = receive_fds(conn, 2)
+        request = json.loads(conn.makefile('rb').readline().decode())
+
+        cwd, env, stdin = os.getcwd(), dict(os.environ), sys.stdin
+        for var in git_environ():
+            del os.environ[var]
+        os.environ.update(request['env'])
+        os.chdir(request['cwd'])
+        if request['stdin'] is not None:
+            sys.stdin = io.StringIO(request['stdin'])
+        repo.timezone = None
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved = [os.dup(1), os.dup(2)]
+        for fd, target in zip(fds, (1, 2)):
+            os.dup2(fd, target)
+
+        out = open(1, 'w', closefd=False)
+        err = open(2, 'w', closefd=False)
+        try:
+            with contextlib.redirect_stdout(out), \
+                    contextlib.redirect_stderr(err):
+                retval = run(request['argv'], repo=repo)
+        except SystemExit as exit:
+            retval = exit.code
+        except Exception:
+            traceback.print_exc(file=err)
+            retval = 1
+        finally:
+            out.close()
+            err.close()
+            for fd, target in zip(saved, (1, 2)):
+                os.dup2(fd, target)
+            for fd in saved + fds:
+                os.close(fd)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+            sys.stdin = stdin
+
+        response = json.dumps({'retval': retval})
+        conn.sendall(response.encode() + b'\n')
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    handle(conn)
+                except OSError as err:
+                    print('Lost connection: {}'.format(err))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(path)
+        albumin.hooks.resident_repo = None
+        albumin.batch.close_warm()
@@ -0,0 +1,149 @@
+# Albumin Timezone Grid
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import math
+import mmap
+import json
+import array
+import struct
+from functools import lru_cache
+
+magic = b'ALBTZG1\n'
+header = struct.Struct('<8sII')
+default_path = os.path.join(os.path.dirname(__file__), 'timezones.grid')
+
+
+class TimezoneGrid:
+    """
+    A memory-mapped raster of timezone names over latitude and
+    longitude, with a fixed number of cells per degree. Each cell holds
+    the index of the timezone covering its center, 0 being none.
+
+    The file is the header, the newline separated timezone names, and
+    the cells as little-endian uint16 rows from -90 to 90 latitude, each
+    going from -180 to 180 longitude.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic_, self.resolution, names_size = header.unpack_from(self.map)
+        if magic_ != magic:
+            raise ValueError(path)
+
+        names = self.map[header.size:header.size + names_size]
+        self.names = [None, *names.decode().split('\n')]
+        self.offset = header.size + names_size
+        self.width = 360 * self.resolution
+        self.height = 180 * self.resolution
+
+    def cell(self, lat, lon):
+        row = int((lat + 90) * self.resolution)
+        col = int((lon + 180) * self.resolution)
+        return min(max(row, 0), self.height - 1), col % self.width
+
+    def lookup(self, lat, lon):
+        row, col = self.cell(lat, lon)
+        pos = self.offset + 2 * (row * self.width + col)
+        index, = struct.unpack_from('<H', self.map, pos)
+        return self.names[index]
+
+    def close(self):
+        self.map.close()
+
+    def __repr__(self):
+        return 'TimezoneGrid(resolution={})'.format(self.resolution)
+
+
+@lru_cache(maxsize=None)
+def open_grid(path=None):
+    path = path or os.environ.get('ALBUMIN_TZGRID', default_path)
+    try:
+        return TimezoneGrid(path)
+    except (OSError, ValueError):
+        return None
+
+
+def timezone_at(lat, lon):
+    """
+    Returns the name of the timezone at the given coordinates, or None
+    if there is no timezone grid or the point is not in any timezone.
+    """
+    grid = open_grid()
+    if grid is None:
+        return None
+    return grid.lookup(lat, lon)
+
+
+def polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        yield geometry['coordinates']
+    elif geometry['type'] == 'MultiPolygon':
+        yield from geometry['coordinates']
+
+
+def build_grid(geojson, path, resolution=10):
+    """
+    Rasterizes a GeoJSON feature collection of timezone polygons with
+    a 'tzid' property, like timezone-boundary-builder's releases, into
+    a timezone grid file.
+    """
+    width, height = 360 * resolution, 180 * resolution
+    cells = array.array('H', bytes(2 * width * height))
+    names = []
+
+    for feature in geojson['features']:
+        names.append(feature['properties']['tzid'])
+        index = len(names)
+
+        for polygon in polygons(feature['geometry']):
+            crossings = {}
+            for ring in polygon:
+                for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+                    if y0 == y1:
+                        continue
+                    lo, hi = sorted([y0, y1])
+                    first = math.ceil((lo + 90) * resolution - 0.5)
+                    last = math.ceil((hi + 90) * resolution - 0.5)
+                    for row in range(max(first, 0), min(last, height)):
+                        y = (row + 0.5) / resolution - 90
+                        x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+                        crossings.setdefault(row, []).append(x)
+
+            for row, xs in crossings.items():
+                xs.sort()
+                for start, end in zip(xs[::2], xs[1::2]):
+                    first = math.ceil((start + 180) * resolution - 0.5)
+                    last = math.ceil((end + 180) * resolution - 0.5)
+                    base = row * width
+                    for col in range(max(first, 0), min(last, width)):
+                        cells[base + col] = index
+
+    names_data = '\n'.join(names).encode()
+    with open(path, 'wb') as file:
+        file.write(header.pack(magic, resolution, len(names_data)))
+        file.write(names_data)
+        if sys.byteorder != 'little':
+            cells.byteswap()
+        cells.tofile(file)
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as file:
+        build_grid(json.load(file), sys.argv[2], *map(int, sys.argv[3:]))
@@ -15,19 +15,18 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import errno
+import hashlib
+import fcntl
+import shutil
 import tarfile
-from exiftool import ExifTool
 
+from albumin.batch import exiftool_batch
+from albumin.batch import run
 
-def exiftool_tags(*paths):
-    with ExifTool() as tool:
-        tags_list = tool.get_tags_batch([], paths)
 
-    tags_dict = {}
-    for tags in tags_list:
-        file = tags.pop('SourceFile')
-        tags_dict[file] = tags
-    return tags_dict
+def exiftool_tags(*paths, jobs=None, tags=None, reduce=None):
+    return run(exiftool_batch(paths, size=jobs, tags=tags, reduce=reduce))
 
 
 def files_in(dir_path, relative=False):
@@ -42,6 +41,70 @@ def files_in(dir_path, relative=False):
             yield os.path.join(root, f)
 
 
+def in_shard(path, shard=None):
+    """
+    Whether the path is in the (index, count) shard, from a hash of the
+    path, so every machine partitions the same files the same way.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.md5(path.encode(errors='surrogateescape')).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
+
+
+def walk_tree(repo, tree, prefix=''):
+    for entry in tree:
+        path = prefix + entry.name
+        if entry.type_str == 'tree':
+            yield from walk_tree(repo, repo[entry.id], path + '/')
+        else:
+            yield path, entry.id
+
+
+FICLONE = 0x40049409
+
+
+def place_file(src, dst, keep=False):
+    """
+    Puts the file at src to dst as cheaply as possible, and returns the
+    way it was done: rename (unless keep), reflink, copy_file_range or
+    copy. Only the last two write the file's contents again.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    if not keep:
+        try:
+            os.rename(src, dst)
+            return 'rename'
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            strategy = 'reflink'
+        except OSError:
+            try:
+                while os.copy_file_range(
+                    fsrc.fileno(), fdst.fileno(), 2**30
+                ):
+                    pass
+                strategy = 'copy_file_range'
+            except (AttributeError, OSError):
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst)
+                strategy = 'copy'
+
+    shutil.copystat(src, dst)
+    if not keep:
+        os.remove(src)
+    return strategy
+
+
 def make_tar(tar_file, dir_path):
     if not os.path.isdir(dir_path):
         raise ValueError("Folder {} doesn't exist.".format(dir_path))
@@ -0,0 +1,222 @@
+# Albumin Inbox Watching
+# Copyright (C) 2016 Alper Nebi Yasak
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from functools import lru_cache
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+watch_mask = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE
+)
+inotify_event = struct.Struct('iIII')
+
+
+@lru_cache(maxsize=None)
+def libc():
+    return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+def inotify_init():
+    """
+    Returns a non-blocking inotify file descriptor, or None if inotify
+    isn't available here.
+    """
+    try:
+        init = libc().inotify_init1
+    except (OSError, AttributeError):
+        return None
+    fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+    return fd if fd >= 0 else None
+
+
+def inotify_add_watch(fd, path, mask):
+    wd = libc().inotify_add_watch(fd, os.fsencode(path), mask)
+    if wd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+    return wd
+
+
+def inotify_events(fd):
+    """
+    Yields (wd, mask, name) for the events that can be read from fd
+    without blocking.
+    """
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = inotify_event.unpack_from(data, pos)
+            pos += inotify_event.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            yield wd, mask, os.fsdecode(name)
+
+
+class Inbox:
+    """
+    A folder that files are dropped into while we run. Tells which of
+    its files are completely written: those that nothing touched for
+    settle seconds, and that were closed if they were written to.
+
+    Uses inotify where available, and scans the folder for changes in
+    each file's size and modify time otherwise. Without inotify, a
+    writer that stalls for settle seconds can't be told apart from one
+    that has finished.
+    """
+
+    def __init__(self, path, settle=2.0):
+        self.path = path
+        self.settle = settle
+        self.fd = inotify_init()
+        self.watches = {}
+        self.changed = {}
+        self.writing = set()
+        self.stats = {}
+        self.add_tree(path)
+
+    def add_tree(self, path):
+        now = time.monotonic()
+        for root, _, files in os.walk(path):
+            if self.fd is not None:
+                try:
+                    wd = inotify_add_watch(self.fd, root, watch_mask)
+                except OSError:
+                    continue
+                self.watches[wd] = root
+            for name in files:
+                self.changed.setdefault(os.path.join(root, name), now)
+
+    def read_events(self, timeout):
+        if self.fd is None:
+            time.sleep(timeout)
+            self.scan()
+            return
+
+        try:
+            select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            pass
+
+        now = time.monotonic()
+        for wd, mask, name in inotify_events(self.fd):
+            if mask & IN_Q_OVERFLOW:
+                self.add_tree(self.path)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+
+            path = os.path.join(self.watches[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.changed.pop(path, None)
+                self.writing.discard(path)
+            else:
+                # Symlinks and hard links are only created, and never
+                # closed after writing, so only writes wait for a close.
+                self.changed[path] = now
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.writing.discard(path)
+                elif mask & IN_MODIFY:
+                    self.writing.add(path)
+
+    def scan(self):
+        now = time.monotonic()
+        stats = {}
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                stats[path] = (st.st_size, st.st_mtime_ns)
+                if self.stats.get(path) != stats[path]:
+                    self.changed[path] = now
+        for path in set(self.changed) - set(stats):
+            del self.changed[path]
+        self.stats = stats
+
+    def ready(self):
+        """
+        Returns the files that are completely written and forgets them,
+        in the order they were last changed.
+        """
+        now = time.monotonic()
+        ready = [
+            path for path, changed in sorted(
+                self.changed.items(), key=lambda item: item[1]
+            )
+            if now - changed >= self.settle and path not in self.writing
+        ]
+        for path in ready:
+            del self.changed[path]
+        return [path for path in ready if os.path.isfile(path)]
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds (forever if None) for some files to
+        be completely written, and returns them.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ready = self.ready()
+            if ready:
+                return ready
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return []
+            step = self.settle / 2
+            if deadline is not None:
+                step = min(step, deadline - now)
+            self.read_events(max(step, 0))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return 'Inbox(path={!r})'.format(self.path)
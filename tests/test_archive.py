@@ -0,0 +1,127 @@
+# Albumin Archive Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import io
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+from unittest import TestCase
+
+from albumin.archive import is_archive
+from albumin.archive import safe_name
+from albumin.archive import key_extension
+from albumin.archive import key_hash
+from albumin.archive import read_archive
+from albumin.archive import archive_heads
+
+
+class TestArchive(TestCase):
+    members = {
+        'DCIM/IMG_20150516_140429.jpg': b'x' * 3000,
+        'DCIM/1431774269.mp4': b'y' * 100,
+    }
+
+    def make_archives(self, temp_dir):
+        tar_path = os.path.join(temp_dir, 'photos.tar.gz')
+        with tarfile.open(tar_path, 'w:gz') as tar:
+            for name, data in self.members.items():
+                info = tarfile.TarInfo(name)
+                info.size, info.mtime = len(data), 1431774269
+                tar.addfile(info, io.BytesIO(data))
+            info = tarfile.TarInfo('../escape.jpg')
+            tar.addfile(info, io.BytesIO(b''))
+
+        zip_path = os.path.join(temp_dir, 'photos.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_:
+            for name, data in self.members.items():
+                zip_.writestr(name, data)
+        return tar_path, zip_path
+
+    def test_read_archive(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for path in self.make_archives(temp_dir):
+                assert is_archive(path)
+                dest = os.path.join(temp_dir, 'out')
+                results = {
+                    name: (key, head)
+                    for name, key, head, _ in read_archive(
+                        path, backend='SHA256E', head_size=10, dest=dest,
+                    )
+                }
+                assert set(results) == set(self.members)
+
+                for name, data in self.members.items():
+                    key, head = results[name]
+                    digest = hashlib.sha256(data).hexdigest()
+                    ext = os.path.splitext(name)[1]
+                    assert key == 'SHA256E-s{}--{}{}'.format(
+                        len(data), digest, ext
+                    )
+                    assert head == data[:10]
+                    with open(os.path.join(dest, name), 'rb') as file:
+                        assert file.read() == data
+
+            assert not os.path.exists(os.path.join(temp_dir, 'escape.jpg'))
+            assert not is_archive(temp_dir)
+
+    def test_archive_heads(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            tar_path, _ = self.make_archives(temp_dir)
+            with archive_heads(tar_path, head_size=1000) as heads:
+                assert sorted(n for n, _ in heads.values()) \
+                    == sorted(self.members)
+                for head, (name, key) in heads.items():
+                    assert key is None
+                    assert os.path.getsize(head) \
+                        == min(len(self.members[name]), 1000)
+                    assert os.path.getmtime(head) == 1431774269
+            assert not any(map(os.path.exists, heads))
+
+    def test_archive_heads_unhashable(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            tar_path, _ = self.make_archives(temp_dir)
+            with archive_heads(tar_path, backend='SKEIN256E',
+                               head_size=1000) as heads:
+                for head, (name, key) in heads.items():
+                    assert key is None
+                    with open(head, 'rb') as file:
+                        assert file.read() == self.members[name]
+                    assert os.path.getmtime(head) == 1431774269
+
+    def test_key_hash(self):
+        digest = lambda backend: key_hash(backend).hexdigest()
+        assert digest('SHA256E') == hashlib.sha256().hexdigest()
+        assert digest('SHA3_256') == hashlib.sha3_256().hexdigest()
+        assert digest('MD5E') == hashlib.md5().hexdigest()
+        assert digest('BLAKE2B256E') == hashlib.blake2b(
+            digest_size=32).hexdigest()
+        assert digest('BLAKE2S160') == hashlib.blake2s(
+            digest_size=20).hexdigest()
+        assert key_hash('SKEIN256E') is None
+        assert key_hash('WORM') is None
+
+    def test_names(self):
+        assert safe_name('a/./b.jpg') == 'a/b.jpg'
+        assert safe_name('/etc/passwd') is None
+        assert safe_name('a/../../b.jpg') is None
+
+        assert key_extension('IMG_1234.JPG') == '.JPG'
+        assert key_extension('photos.tar.gz') == '.tar.gz'
+        assert key_extension('a.b.c.jpg') == '.c.jpg'
+        assert key_extension('IMG.20150516.jpg') == '.jpg'
+        assert key_extension('noext') == ''
@@ -0,0 +1,161 @@
+# Albumin Batch Process Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import asyncio
+import tempfile
+from unittest import TestCase
+
+from albumin.batch import BatchProcess
+from albumin.batch import ExifToolBatch
+from albumin.batch import BatchPool
+from albumin.batch import run
+
+
+fake_exiftool = """
+import sys, json
+args = []
+for line in sys.stdin:
+    line = line.rstrip('\\n')
+    if line != '-execute':
+        args.append(line)
+        continue
+    files = [arg for arg in args if not arg.startswith('-')]
+    tags = [{'SourceFile': f, 'EXIF:Pad': 'x' * 50000} for f in files]
+    sys.stdout.write(json.dumps(tags) + '\\n{ready}\\n')
+    sys.stdout.flush()
+    args = []
+"""
+
+
+stall_once = """
+import os, sys, time
+for line in sys.stdin:
+    if line == 'stall\\n' and not os.path.exists(sys.argv[1]):
+        open(sys.argv[1], 'w').close()
+        time.sleep(60)
+    sys.stdout.write(line)
+    sys.stdout.flush()
+"""
+
+
+class FakeExifToolBatch(ExifToolBatch):
+    def __init__(self):
+        BatchProcess.__init__(self, sys.executable, '-c', fake_exiftool)
+
+
+class TestBatchProcess(TestCase):
+    def test_pipelined_order(self):
+        requests = [str(i) for i in range(1000)]
+
+        async def echo_all():
+            async with BatchPool(lambda: BatchProcess('cat'), 4) as pool:
+                return await asyncio.gather(*map(pool.request, requests))
+
+        assert run(echo_all()) == requests
+
+    def test_broken_pipe(self):
+        async def request_true():
+            process = BatchProcess('true')
+            try:
+                return await process.request('x')
+            finally:
+                await process.close()
+
+        with self.assertRaises(BrokenPipeError):
+            run(request_true())
+
+    def test_timeout(self):
+        async def request_sleep():
+            process = BatchProcess('sleep', '60')
+            try:
+                return await process.request('x', timeout=0.1)
+            finally:
+                await process.close()
+
+        with self.assertRaises(BrokenPipeError):
+            run(request_sleep())
+
+    def test_large_response(self):
+        files = ['{}.jpg'.format(i) for i in range(16)]
+
+        async def request_tags():
+            process = FakeExifToolBatch()
+            try:
+                return await asyncio.wait_for(process.request(files), 10)
+            finally:
+                await process.close()
+
+        tags = run(request_tags())
+        assert [t['SourceFile'] for t in tags] == files
+        assert all(len(t['EXIF:Pad']) == 50000 for t in tags)
+
+    def test_kill_and_retry(self):
+        async def requests(flag):
+            process = BatchProcess(sys.executable, '-c', stall_once, flag)
+            try:
+                first = await asyncio.gather(*(
+                    process.request(request, timeout=0.5)
+                    for request in ['a', 'stall', 'b']
+                ), return_exceptions=True)
+                second = await asyncio.gather(*(
+                    process.request(request, timeout=0.5)
+                    for request in ['stall', 'b']
+                ))
+                return first, second
+            finally:
+                await process.close()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            flag = os.path.join(temp_dir, 'stalled')
+            first, second = run(requests(flag))
+
+        assert first[0] == 'a'
+        assert isinstance(first[1], BrokenPipeError)
+        assert isinstance(first[2], BrokenPipeError)
+        assert second == ['stall', 'b']
+
+    def test_restart_reaps(self):
+        async def requests():
+            # Answers once, closes its output and keeps running
+            process = BatchProcess(
+                'sh', '-c', 'head -n 1; exec sleep 60 >&-')
+            try:
+                assert await process.request('a') == 'a'
+                await process._reader
+                first = process._process
+                assert await process.request('b') == 'b'
+                assert process._process is not first
+                assert first.returncode is not None
+            finally:
+                await process.kill()
+
+        run(requests())
+
+    def test_kill_unread(self):
+        async def kill_yes():
+            process = BatchProcess('yes')
+            assert await process.request('x') == 'y'
+            process._reader.cancel()
+            pending = asyncio.get_event_loop().create_future()
+            process._pending.append(pending)
+            await asyncio.sleep(0.2)
+            await asyncio.wait_for(process.kill(), 5)
+            with self.assertRaises(BrokenPipeError):
+                await pending
+
+        run(kill_yes())
@@ -0,0 +1,103 @@
+# Albumin Consistency Check Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from albumin.check import init_worker
+from albumin.check import check_files
+from albumin.check import check_reports
+from albumin.check import latest_results
+
+
+class TestCheck(TestCase):
+    fields = {
+        'KEY1': {
+            'datetime': ['2014-07-15@09-30-00'],
+            'datetime-method': ['ExifTool/EXIF/DateTimeOriginal'],
+            'timezone': ['UTC'],
+            'year': ['2014'], 'month': ['07'], 'day': ['15'],
+        },
+        'KEY2': {
+            'datetime': ['2014-07-15@09-30-00'],
+            'datetime-method': ['Filename/Delimited'],
+            'year': ['2014'], 'month': ['08'], 'day': ['15'],
+        },
+    }
+
+    def setUp(self):
+        init_worker(self.fields)
+
+    def test_check_files(self):
+        violations = check_files([
+            ('20140715T093000Z00.jpg', 'KEY1'),
+            ('20140715T093100Z00.jpg', 'KEY2'),
+            ('IMG_0001.jpg', 'KEY3'),
+        ])
+        checks = {(v['key'], v['check']) for v in violations}
+        assert checks == {
+            ('KEY2', 'month'), ('KEY2', 'name'), ('KEY3', 'undated'),
+        }
+
+    def test_check_reports(self):
+        message = '\n'.join([
+            'Import files', '',
+            '[report]',
+            '[K+] KEY1',
+            '[ F] :: 20140715T093000Z00.jpg',
+            '[ T] :: 2014-07-15 09:30:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+            '[K+] KEY2',
+            '[ F] :: 20140715T093000Z01.jpg',
+            '[ T] :: 2014-07-15 09:30:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+        ])
+        violations = list(latest_results(
+            check_reports([(1, 'abc123', message)])
+        ))
+        assert [(v['commit'], v['key']) for v in violations] == \
+            [('abc123', 'KEY2')]
+
+        older = '\n'.join([
+            'Import files', '',
+            '[report]',
+            '[K+] KEY1',
+            '[ F] :: 20140715T100000Z00.jpg',
+            '[ T] :: 2014-07-15 10:00:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+        ])
+        newer = '\n'.join([
+            'Fix dates', '',
+            '[report]',
+            '[K!] KEY1',
+            '[ F] :: 20140715T093000Z00.jpg',
+            '[ T] :: 2014-07-15 09:30:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+            '[ t] :: 2014-07-15 10:00:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+        ])
+        violations = list(latest_results(check_reports([
+            (1, 'abc123', older), (0, 'def456', newer),
+        ])))
+        assert violations == []
+
+    def test_check_layout(self):
+        init_worker(self.fields, '%Y/%m')
+        violations = check_files([
+            ('2014/07/20140715T093000Z00.jpg', 'KEY1'),
+            ('20140715T093000Z01.jpg', 'KEY1'),
+        ])
+        assert [(v['path'], v['check']) for v in violations] == \
+            [('20140715T093000Z01.jpg', 'layout')]
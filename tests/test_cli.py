@@ -0,0 +1,65 @@
+# Albumin CLI Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import subprocess
+from unittest import TestCase
+
+import pygit2
+from tests.utils import with_folder
+
+
+class TestStartup(TestCase):
+    heavy_modules = [
+        'pytz', 'pygit2', 'asyncio', 'git_annex_adapter',
+        'albumin.repo', 'albumin.imdate', 'albumin.core',
+    ]
+
+    def test_hook_imports(self):
+        script = (
+            'import sys, albumin.cli\n'
+            'print(*(m for m in {!r} if m in sys.modules))\n'
+        ).format(self.heavy_modules)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        assert output.decode().split() == []
+
+    def test_core_imports(self):
+        subcommand_modules = [
+            'albumin.check', 'albumin.watch', 'albumin.export',
+            'albumin.server', 'albumin.dateindex', 'albumin.archive',
+            'multiprocessing', 'sqlite3',
+        ]
+        script = (
+            'import sys, albumin.core\n'
+            'print(*(m for m in {!r} if m in sys.modules))\n'
+        ).format(subcommand_modules)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        assert output.decode().split() == []
+
+    @with_folder()
+    def test_forward_imports(self, temp_folder):
+        script = (
+            'import sys, albumin.cli\n'
+            'albumin.cli.forward(["albumin", "check"], {{}})\n'
+            'print(*(m for m in {!r} if m in sys.modules))\n'
+        ).format(self.heavy_modules)
+        pygit2.init_repository(temp_folder)
+        output = subprocess.check_output(
+            [sys.executable, '-c', script], cwd=temp_folder,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        )
+        assert output.decode().split() == []
@@ -0,0 +1,54 @@
+# Albumin Date Index Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from tests.utils import with_folder
+from tests.utils import fake_repo
+
+from albumin.dateindex import DateIndex
+
+
+def fields(dt, method):
+    return {'datetime': [dt], 'datetime-method': [method]}
+
+
+class TestDateIndex(TestCase):
+    @with_folder()
+    def test_stats(self, temp_folder):
+        repo = fake_repo(temp_folder)
+        exif = 'ExifTool/EXIF/DateTimeOriginal'
+        unix = 'Filename/UNIX'
+
+        with DateIndex(repo) as index:
+            index.update_key('A', fields('2014-07-15@10-00-00', exif))
+            index.update_key('B', fields('2014-08-01@10-00-00', unix))
+            index.update_key('C', fields('2015-01-01@10-00-00', unix))
+            assert list(index.stats()) == [
+                (2014, None, exif, 1),
+                (2014, None, unix, 1),
+                (2015, None, unix, 1),
+            ]
+
+            index.update_key('B', fields('2014-08-01@10-00-00', exif))
+            index.update_key('C', None)
+            assert list(index.stats(monthly=True)) == [
+                (2014, 7, exif, 1),
+                (2014, 8, exif, 1),
+            ]
+
+            index.db.execute('DELETE FROM counts')
+            index.rebuild_counts()
+            assert list(index.stats()) == [(2014, None, exif, 2)]
@@ -0,0 +1,38 @@
+# Albumin Disk Ordering Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+from unittest import TestCase
+
+from albumin.diskorder import disk_order
+from albumin.diskorder import readahead
+
+
+class TestDiskOrder(TestCase):
+    def test_disk_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for i in range(20):
+                paths.append(os.path.join(temp_dir, '{}.jpg'.format(i)))
+                with open(paths[-1], 'wb') as file:
+                    file.write(os.urandom(4096))
+            paths.append(os.path.join(temp_dir, 'missing.jpg'))
+
+            ordered = disk_order(reversed(paths))
+            assert sorted(ordered) == sorted(paths)
+            assert ordered[0] == paths[-1]
+            readahead(ordered)
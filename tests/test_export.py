@@ -0,0 +1,85 @@
+# Albumin Export Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import gzip
+import tarfile
+import tempfile
+from unittest import TestCase
+from tests.utils import fake_repo
+
+from albumin.export import GzipBlocks
+from albumin.export import export_tar
+
+
+class TestExport(TestCase):
+    def test_gzip_blocks(self):
+        data = os.urandom(5000) + b'a' * 10000
+        out = io.BytesIO()
+        blocks = GzipBlocks(out, jobs=3, block_size=1024)
+        for i in range(0, len(data), 700):
+            blocks.write(data[i:i+700])
+        blocks.close()
+        assert gzip.decompress(out.getvalue()) == data
+
+    def test_export_tar(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo = fake_repo(temp_dir)
+            objects = os.path.join(temp_dir, 'objects')
+            os.mkdir(objects)
+            os.mkdir(os.path.join(temp_dir, '2015'))
+
+            contents = {}
+            for i in range(5):
+                path = '2015/20150516T1104{:02}Z.jpg'.format(i)
+                contents[path] = os.urandom(3000)
+                with open(os.path.join(objects, str(i)), 'wb') as file:
+                    file.write(contents[path])
+                os.symlink(
+                    os.path.join(objects, str(i)),
+                    os.path.join(temp_dir, path),
+                )
+            os.symlink(
+                os.path.join(objects, 'gone'),
+                os.path.join(temp_dir, '2015/20150516T110499Z.jpg'),
+            )
+
+            # Unlocked files, with and without their content
+            path = '2015/20150516T110498Z.jpg'
+            contents[path] = os.urandom(3000)
+            with open(os.path.join(temp_dir, path), 'wb') as file:
+                file.write(contents[path])
+            with open(os.path.join(temp_dir, '2015/pointer.jpg'), 'w') as file:
+                file.write('/annex/objects/SHA256E-s3000--abc.jpg\n')
+
+            for compress in (True, False):
+                out = io.BytesIO()
+                exported, missing = export_tar(
+                    repo, out, sorted(contents) + [
+                        '2015/20150516T110499Z.jpg', '2015/pointer.jpg',
+                    ], jobs=2, compress=compress,
+                )
+                assert list(exported) == sorted(contents)
+                assert missing == [
+                    '2015/20150516T110499Z.jpg', '2015/pointer.jpg',
+                ]
+
+                out.seek(0)
+                with tarfile.open(fileobj=out, mode='r:*') as tar:
+                    assert tar.getnames() == sorted(contents)
+                    for path, data in contents.items():
+                        assert tar.extractfile(path).read() == data
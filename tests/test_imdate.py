@@ -21,6 +21,11 @@ from datetime import datetime
 
 from albumin.imdate import from_exif
 from albumin.imdate import analyze_date
+from albumin.imdate import exif_imdate
+from albumin.imdate import exif_timezone
+from albumin.imdate import parse_offset
+from albumin.imdate import ImageDate
+from albumin.imdate import Report
 
 
 class TestImageDates(TestCase):
@@ -42,3 +47,45 @@ class TestImageDates(TestCase):
 
         results, remaining = analyze_date(a, b, c)
         assert remaining
+
+    def test_exif_timezone(self):
+        imdate = ImageDate(
+            'ExifTool/EXIF/DateTimeOriginal',
+            datetime(2015, 5, 16, 14, 4, 29),
+        )
+        exif_timezone(imdate, {'EXIF:OffsetTimeOriginal': '+03:00'})
+        assert imdate.timezone == 'Etc/GMT-3'
+        assert parse_offset('-05:30') == -330
+
+    def test_exif_imdate(self):
+        imdate = exif_imdate('A000.jpg', {
+            'EXIF:ModifyDate': '2015:05:17 10:00:00',
+            'EXIF:DateTimeOriginal': '2015:05:16 14:04:29',
+            'EXIF:Make': 'Camera',
+        }, useful_tags=['EXIF:DateTimeOriginal', 'EXIF:ModifyDate'])
+        assert imdate.method == 'ExifTool/EXIF/DateTimeOriginal'
+        assert imdate.datetime == datetime(2015, 5, 16, 14, 4, 29)
+
+    def test_merge_reports(self):
+        exif = ImageDate(
+            'ExifTool/EXIF/DateTimeOriginal',
+            datetime(2015, 5, 16, 14, 4, 29),
+        )
+        name = ImageDate('Filename/Delimited', datetime(2015, 5, 16))
+        a = Report({'a.jpg': 'KEY1', 'c.jpg': 'KEY2'}, {'KEY1': exif}, [])
+        b = Report({'b.jpg': 'KEY1', 'd.jpg': 'KEY3'}, {'KEY1': name},
+                   ['d.jpg'])
+
+        report = Report.merge(a, b)
+        assert report.updates['KEY1'] == (exif, None)
+        assert set(report.additions) == {'a.jpg', 'b.jpg'}
+        assert set(report.redundants) == {'c.jpg'}
+        assert set(report.remaining) == {'d.jpg'}
+
+        other = ImageDate(
+            'ExifTool/EXIF/DateTimeOriginal',
+            datetime(2016, 5, 16, 14, 4, 29),
+        )
+        c = Report({'e.jpg': 'KEY1'}, {'KEY1': other}, [])
+        with self.assertRaises(RuntimeError):
+            Report.merge(a, c)
@@ -0,0 +1,70 @@
+# Albumin Import Journal Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import TestCase
+from datetime import datetime
+from tests.utils import with_folder
+from tests.utils import fake_repo
+
+from albumin.imdate import ImageDate
+from albumin.journal import ImportJournal
+from albumin.journal import dump_imdate
+from albumin.journal import load_imdate
+
+
+class TestImportJournal(TestCase):
+    @with_folder()
+    def test_resume(self, temp_folder):
+        repo = fake_repo(temp_folder)
+
+        journal = ImportJournal(repo, '/src')
+        journal.record('src/a.jpg', 'keyed', key='KEY-A')
+        journal.record('src/b.jpg', 'keyed', key='KEY-B')
+        journal.record('src/a.jpg', 'dated', new=None, old=None)
+        journal.record('src/b.jpg', 'pending')
+        journal.checkpoint()
+
+        journal = ImportJournal(repo, '/src')
+        assert journal.files['src/a.jpg']['stage'] == 'dated'
+        assert journal.files['src/a.jpg']['key'] == 'KEY-A'
+        assert journal.files['src/b.jpg']['stage'] == 'keyed'
+
+        journal = ImportJournal(repo, '/src', retry=False)
+        assert journal.files['src/b.jpg']['stage'] == 'pending'
+
+        other = ImportJournal(repo, '/elsewhere')
+        assert other.path != journal.path
+        assert not other.files
+
+    @with_folder()
+    def test_finish(self, temp_folder):
+        repo = fake_repo(temp_folder)
+        journal = ImportJournal(repo, '/src')
+        journal.record('src/a.jpg', 'arranged', key='KEY-A')
+        journal.finish()
+        assert not os.path.exists(journal.path)
+
+    def test_imdate_roundtrip(self):
+        imdate = ImageDate(
+            'ExifTool/EXIF/DateTimeOriginal',
+            datetime(2015, 5, 16, 14, 4, 29),
+        )
+        imdate.timezone = 'Europe/Istanbul'
+        loaded = load_imdate(dump_imdate(imdate))
+        assert loaded.method == imdate.method
+        assert loaded.datetime == imdate.datetime
+        assert loaded.timezone == imdate.timezone
@@ -0,0 +1,77 @@
+# Albumin Key Cache Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from unittest import TestCase
+
+from tests.utils import with_folder
+from tests.utils import fake_repo
+
+from albumin.keycache import KeyCache
+
+
+class TestKeyCache(TestCase):
+    key = 'SHA256E-s5--abc.jpg'
+
+    def write(self, path, data, age=0):
+        with open(path, 'wb') as file:
+            file.write(data)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return os.stat(path)
+
+    @with_folder()
+    def test_get_put(self, temp_folder):
+        cache = KeyCache(fake_repo(temp_folder))
+        cache.racy_ns = 0
+        path = os.path.join(temp_folder, 'a.jpg')
+
+        st = self.write(path, b'aaaaa', age=60)
+        assert cache.get(path, st) is None
+        cache.put(path, self.key, st)
+        assert cache.get(path, st) == self.key
+        cache.close()
+
+        cache = KeyCache(fake_repo(temp_folder))
+        assert cache.get(path, os.stat(path)) == self.key
+        st = self.write(path, b'bbbbbb', age=60)
+        assert cache.get(path, st) is None
+        cache.close()
+
+    @with_folder()
+    def test_backend(self, temp_folder):
+        cache = KeyCache(fake_repo(temp_folder))
+        cache.racy_ns = 0
+        path = os.path.join(temp_folder, 'a.jpg')
+
+        st = self.write(path, b'aaaaa', age=60)
+        cache.put(path, self.key, st)
+        assert cache.get(path, st, 'SHA256E') == self.key
+        assert cache.get(path, st, 'SHA256') is None
+        assert cache.get(path, st, 'MD5E') is None
+        cache.close()
+
+    @with_folder()
+    def test_racy(self, temp_folder):
+        cache = KeyCache(fake_repo(temp_folder))
+        path = os.path.join(temp_folder, 'a.jpg')
+
+        # Changed too recently to be told apart from a later change
+        st = self.write(path, b'aaaaa')
+        cache.put(path, self.key, st)
+        assert cache.get(path, st) is None
+        cache.close()
@@ -0,0 +1,82 @@
+# Albumin Metadata Log Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from albumin.metalog import key_from_path
+from albumin.metalog import key_log_path
+from albumin.metalog import parse_log
+from albumin.metalog import compact_log
+from albumin.metalog import journal_path
+from albumin.metalog import journal_unmangle
+
+
+class TestMetadataLogs(TestCase):
+    def test_key_from_path(self):
+        path = '6b2/e4d/SHA256E-s0--e3b0&c&a&s%x.jpg.log.met'
+        assert key_from_path(path) == 'SHA256E-s0--e3b0:&%/x.jpg'
+
+    def test_key_log_path(self):
+        key = 'SHA256E-s0--e3b0:&%/x.jpg'
+        assert key_from_path(key_log_path(key)) == key
+
+    def test_journal_path(self):
+        path = '6b2/e4d/SHA256E-s0--e3b0_x.jpg.log.met'
+        assert journal_unmangle(journal_path(path)) == path
+
+    def test_parse_log(self):
+        log = (
+            '1480000002.5s datetime +2016-01-01@00-00-00 '
+            '-2015-01-01@00-00-00 album +!YSBi\n'
+            '1480000001s datetime +2015-01-01@00-00-00 year +2015\n'
+        )
+        assert parse_log(log) == {
+            'datetime': ['2016-01-01@00-00-00'],
+            'year': ['2015'],
+            'album': ['a b'],
+        }
+
+    def test_compact_log(self):
+        text = (
+            '1500000000.5s datetime +2014-07-15@09-30-00 year +2014\n'
+            '1500000100s datetime -2014-07-15@09-30-00 '
+            '+2014-07-15@09-31-00 tag +a\n'
+            '1500000200s tag -a\n'
+        )
+        compacted = compact_log(text)
+        assert parse_log(compacted) == parse_log(text)
+        assert compacted == (
+            '1500000000.5s year +2014\n'
+            '1500000100s datetime -2014-07-15@09-30-00 '
+            '+2014-07-15@09-31-00\n'
+            '1500000200s tag -a\n'
+        )
+
+    def test_compact_log_merge(self):
+        older = '1500000000s datetime +A tag +a\n'
+        text = older + (
+            '1500000100s datetime -A +B\n'
+            '1500000150s tag -a\n'
+            '1500000200s tag +b\n'
+        )
+        compacted = compact_log(text)
+        assert len(compacted) < len(text)
+
+        # git-annex union-merges a clone's older log with ours
+        merged = ''.join(sorted(set(
+            (older + compacted).splitlines(keepends=True)
+        )))
+        assert parse_log(merged) == {'datetime': ['B'], 'tag': ['b']}
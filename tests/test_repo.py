@@ -0,0 +1,420 @@
+# Albumin Repo Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import tarfile
+import subprocess
+from datetime import datetime
+from collections.abc import Mapping
+from unittest import TestCase
+from unittest import mock
+
+import pygit2
+from tests.utils import with_folder
+from tests.utils import with_git_repo
+
+from albumin.archive import read_archive
+from albumin.imdate import ImageDate
+from albumin.imdate import Report
+from albumin.repo import AlbuminMetadata
+from albumin.repo import GitAnnexMetadata
+from albumin.journal import ImportJournal
+from albumin.utils import walk_tree
+
+
+def commit_files(repo, files, tree=None):
+    if tree is None:
+        builder = repo.TreeBuilder()
+        for name, (data, mode) in files.items():
+            builder.insert(name, repo.create_blob(data), mode)
+        tree = builder.write()
+    sig = pygit2.Signature('Albumin', 'albumin@example.com')
+    parents = [] if repo.head_is_unborn else [repo.head.target]
+    return repo.create_commit('HEAD', sig, sig, 'Commit', tree, parents)
+
+
+class TestAlbuminRepo(TestCase):
+    @with_folder()
+    @with_git_repo()
+    def test_resume_placed(self, repo, temp_folder):
+        source = os.path.join(temp_folder, 'DCIM')
+        os.mkdir(source)
+        prefix = repo.import_prefix(source)
+
+        # A run that stopped after moving a.jpg, before journaling it
+        os.makedirs(repo.abs_path(prefix))
+        with open(repo.abs_path(os.path.join(prefix, 'a.jpg')), 'w'):
+            pass
+
+        def new_files(keys=True):
+            if ('add', prefix + '/') not in repo.annex.calls:
+                return {}
+            return {os.path.join(prefix, 'a.jpg'): 'KEY-A'}
+
+        chunks = []
+        repo.new_files = new_files
+        repo._import_chunk = lambda journal, chunk, *args: \
+            chunks.append(chunk)
+
+        repo.import_journaled(source, commit_msg=None)
+        assert chunks == [[os.path.join(prefix, 'a.jpg')]]
+
+    @with_git_repo()
+    def test_resume_committed(self, repo):
+        def link(key, depth=0):
+            target = '../' * depth + \
+                '.git/annex/objects/xx/yy/{0}/{0}'.format(key)
+            return target.encode(), pygit2.GIT_FILEMODE_LINK
+
+        # A run that stopped after committing a.jpg, before writing the
+        # index and the journal, after writing the index for c.jpg, and
+        # before committing b.jpg
+        done = '20140715T093000Z00.jpg'
+        written = '20140715T093000Z02.jpg'
+        commit_files(repo, {done: link('KEY-A'), written: link('KEY-C')})
+        repo.index.add(pygit2.IndexEntry(
+            written, repo.create_blob(link('KEY-C')[0]),
+            pygit2.GIT_FILEMODE_LINK,
+        ))
+        for name in ('a.jpg', 'b.jpg'):
+            data, mode = link('KEY-' + name[0].upper(), depth=1)
+            path = repo.abs_path('src/' + name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.symlink(data.decode(), path)
+            repo.index.add(pygit2.IndexEntry(
+                'src/' + name, repo.create_blob(data), mode,
+            ))
+        repo.index.write()
+
+        journal = ImportJournal(repo, '/src')
+        journal.record('src/a.jpg', 'metadata', key='KEY-A', dest=done,
+                       new=None, old=None)
+        journal.record('src/b.jpg', 'metadata', key='KEY-B', dest=done,
+                       new=None, old=None)
+        journal.record('src/c.jpg', 'metadata', key='KEY-C', dest=written,
+                       new=None, old=None)
+
+        repo.datetime_name = lambda file, key: '20140715T093000Z{:02}.jpg'
+        repo.commit = lambda message, tree: commit_files(repo, {}, tree)
+        messages = []
+        repo._write_chunk(journal, journal.at, messages.append, {})
+
+        tree = repo.head.peel(pygit2.Commit).tree
+        assert sorted(path for path, _ in walk_tree(repo, tree)) == \
+            [done, '20140715T093000Z01.jpg', written]
+        assert [f for f, _ in messages[0].files.items()] == \
+            [repo.abs_path('src/b.jpg')]
+        assert {e.path for e in repo.index} == \
+            {done, '20140715T093000Z01.jpg', written}
+        assert not os.path.lexists(repo.abs_path('src'))
+        assert os.readlink(repo.abs_path(done)).endswith('KEY-A')
+        assert os.readlink(repo.abs_path(written)).endswith('KEY-C')
+        assert set(journal.at('arranged')) == \
+            {'src/a.jpg', 'src/b.jpg', 'src/c.jpg'}
+
+    @with_folder()
+    @with_git_repo()
+    def test_extract_archive(self, repo, temp_folder):
+        path = os.path.join(temp_folder, 'photos.tar')
+        with tarfile.open(path, 'w') as tar:
+            for name, data in [('a.jpg', b'a'), ('DCIM/b.jpg', b'b')]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+        keys = {
+            name: key for name, key, _, _
+            in read_archive(path, backend='SHA256E')
+        }
+        link = '.git/annex/objects/xx/yy/{0}/{0}'.format(keys['DCIM/b.jpg'])
+        commit_files(repo, {'b.jpg': (link, pygit2.GIT_FILEMODE_LINK)})
+
+        placed = repo.extract_archive(path, 'photos')
+        assert list(placed) == ['photos/a.jpg']
+        assert not os.path.exists(repo.abs_path('photos/DCIM/b.jpg'))
+
+        # As if a.jpg was annexed, before the import was interrupted
+        os.remove(repo.abs_path('photos/a.jpg'))
+        os.symlink('/nonexistent/object', repo.abs_path('photos/a.jpg'))
+        assert repo.extract_archive(path, 'photos') == {}
+        assert os.path.islink(repo.abs_path('photos/a.jpg'))
+
+    @with_git_repo()
+    def test_tree_with(self, repo):
+        blob = pygit2.GIT_FILEMODE_BLOB
+        commit_files(repo, {'z': (b'z', blob)})
+        tree = repo.tree_with(repo.head.peel(pygit2.Commit).tree, {
+            'a/b/x': (repo.create_blob(b'x'), blob),
+            'a/y': (repo.create_blob(b'y'), blob),
+        })
+        tree = repo.tree_with(repo[tree], {
+            'a/b/x': None,
+            'a/new': (repo.create_blob(b'new'), blob),
+            'c/d/e': (repo.create_blob(b'e'), blob),
+            'missing': None,
+        })
+        assert {
+            path: repo[oid].data for path, oid in walk_tree(repo, repo[tree])
+        } == {'a/new': b'new', 'a/y': b'y', 'c/d/e': b'e', 'z': b'z'}
+
+    @with_git_repo()
+    def test_plan_names(self, repo):
+        def link(key):
+            target = '.git/annex/objects/xx/yy/{0}/{0}'.format(key)
+            return target.encode(), pygit2.GIT_FILEMODE_LINK
+
+        commit_files(repo, {
+            '20140715T093000Z00.jpg': link('KEY1'),
+            '20140715T093000Z02.jpg': link('KEY4'),
+        })
+        repo.datetime_name = lambda file, key: \
+            None if key == 'KEY0' else '20140715T093000Z{:02}.jpg'
+
+        moves = repo.plan_names({
+            'a.jpg': 'KEY2', 'b.jpg': 'KEY3', 'c.jpg': 'KEY1',
+            'd.jpg': 'KEY0',
+        }, repo.head.peel(pygit2.Commit).tree)
+        assert moves == {
+            'a.jpg': '20140715T093000Z01.jpg',
+            'b.jpg': '20140715T093000Z03.jpg',
+            'c.jpg': '20140715T093000Z00.jpg',
+            'd.jpg': 'd.jpg',
+        }
+
+    @with_git_repo()
+    def test_relayout(self, repo):
+        target = '.git/annex/objects/xx/yy/KEY1/KEY1'
+        commit_files(repo, {
+            '20140715T093000Z00.jpg':
+                (target.encode(), pygit2.GIT_FILEMODE_LINK),
+            'IMG_0001.jpg': (b'x', pygit2.GIT_FILEMODE_BLOB),
+        })
+        repo.checkout_head(strategy=pygit2.GIT_CHECKOUT_FORCE)
+        repo.commit = lambda message, tree: commit_files(repo, {}, tree)
+
+        repo.config['albumin.layout'] = '%Y/%m'
+        moves = repo.relayout()
+        dest = '2014/07/20140715T093000Z00.jpg'
+        assert moves == {'20140715T093000Z00.jpg': dest}
+
+        tree = repo.head.peel(pygit2.Commit).tree
+        assert sorted(path for path, _ in walk_tree(repo, tree)) == \
+            [dest, 'IMG_0001.jpg']
+        assert repo[tree[dest].id].data.decode() == '../../' + target
+        assert os.readlink(repo.abs_path(dest)) == '../../' + target
+        assert not os.path.lexists(repo.abs_path('20140715T093000Z00.jpg'))
+        assert repo.index[dest].id == tree[dest].id
+
+        # Missing from the work tree, but still tracked
+        os.remove(repo.abs_path(dest))
+        repo.config['albumin.layout'] = ''
+        assert repo.relayout() == {dest: '20140715T093000Z00.jpg'}
+        assert os.readlink(repo.abs_path('20140715T093000Z00.jpg')) == target
+        tree = repo.head.peel(pygit2.Commit).tree
+        assert repo[tree['20140715T093000Z00.jpg'].id].data.decode() \
+            == target
+
+    @with_git_repo()
+    def test_arrange_workdir(self, repo):
+        old = b'../.git/annex/objects/xx/yy/KEY-O/KEY-O'
+        commit_files(repo, {}, repo.tree_with(None, {
+            'keep.jpg': (repo.create_blob(b'k'), pygit2.GIT_FILEMODE_BLOB),
+            'old/20140101T000000Z00.jpg':
+                (repo.create_blob(old), pygit2.GIT_FILEMODE_LINK),
+        }))
+        repo.checkout_head(strategy=pygit2.GIT_CHECKOUT_FORCE)
+        repo.index.read_tree(repo.head.peel(pygit2.Commit).tree)
+        for path in ('keep.jpg', 'old/20140101T000000Z00.jpg'):
+            os.utime(repo.abs_path(path), (1400000000, 1400000000),
+                     follow_symlinks=False)
+        before = {
+            path: os.lstat(repo.abs_path(path))
+            for path in ('keep.jpg', 'old/20140101T000000Z00.jpg')
+        }
+
+        target = '.git/annex/objects/xx/yy/KEY-N/KEY-N'
+        os.symlink(target, repo.abs_path('new.jpg'))
+        repo.index.add(pygit2.IndexEntry(
+            'new.jpg', repo.create_blob(target.encode()),
+            pygit2.GIT_FILEMODE_LINK,
+        ))
+        repo.index.write()
+
+        repo.datetime_name = lambda file, key, imdates: \
+            '20140715T093000Z{:02}.jpg'
+        repo.arrange_by_imdates({'new.jpg': 'KEY-N'})
+
+        assert not os.path.lexists(repo.abs_path('new.jpg'))
+        assert os.readlink(repo.abs_path('20140715T093000Z00.jpg')) == target
+        assert repo.annex.calls == [('pre-commit', '20140715T093000Z00.jpg')]
+        for path, st in before.items():
+            after = os.lstat(repo.abs_path(path))
+            assert (after.st_ino, after.st_mtime_ns) == \
+                (st.st_ino, st.st_mtime_ns)
+
+    @with_git_repo()
+    def test_imdate_diff_keyless(self, repo):
+        imdate = ImageDate(
+            'Filename/Delimited', datetime(2014, 7, 15, 9, 30),
+        )
+        imdate.timezone = 'UTC'
+
+        def analyze_date(*paths, **kwargs):
+            return Report(paths, {path: imdate for path in paths}, set())
+
+        with mock.patch('albumin.repo.analyze_date', analyze_date):
+            report = repo.imdate_diff({
+                '/src/20140715_093000.jpg': 'KEY-A',
+                '/src/20140715_093001.jpg': None,
+            })
+        assert list(report.additions) == ['/src/20140715_093000.jpg']
+        assert list(report.remaining) == ['/src/20140715_093001.jpg']
+
+    @with_git_repo()
+    def test_merge_annex(self, repo):
+        sig = pygit2.Signature('Albumin', 'albumin@example.com')
+        tree = repo.TreeBuilder().write()
+
+        repo.merge_annex()
+        local = repo.create_commit(
+            'refs/heads/git-annex', sig, sig, 'Local', tree, []
+        )
+        repo.references.create('refs/remotes/origin/git-annex', local)
+        repo.merge_annex()
+        assert repo.annex.calls == []
+
+        repo.create_commit(
+            'refs/remotes/origin/git-annex', sig, sig, 'Remote', tree,
+            [local],
+        )
+        repo.merge_annex()
+        assert repo.annex.calls == [('merge',)]
+
+    @with_git_repo()
+    def test_report_blob(self, repo):
+        repo.config['user.name'] = 'Albumin'
+        repo.config['user.email'] = 'albumin@example.com'
+        report = Report.parse([
+            '[K+] KEY1',
+            '[ F] :: 20140715T093000Z00.jpg',
+            '[ T] :: 2014-07-15 09:30:00 @ (UTC) '
+            '(ExifTool/EXIF/DateTimeOriginal)',
+        ])
+        short = list(report.short())
+        assert repo.report_section(report) == ['[report]', *short]
+
+        repo.config['albumin.report-blob'] = 'true'
+        section = repo.report_section(report)
+        assert len(section) == 1
+        message = '\n'.join(['Import files', '', *section])
+        blob = repo.report_blob(message)
+        assert list(repo.load_report(blob).short()) == short
+
+        commit = commit_files(repo, {})
+        repo.keep_report(commit, message)
+        repo.keep_report(commit, 'Commit without a report')
+        notes = repo.lookup_reference(repo.report_notes)
+        notes = notes.peel(pygit2.Commit)
+        assert [entry.name for entry in notes.tree] == [str(commit)]
+        assert str(notes.tree[str(commit)].id) == blob
+
+        with self.assertRaises(ValueError):
+            repo.load_report('0' * 40)
+
+    @with_git_repo()
+    def test_write_lock(self, repo):
+        path = os.path.join(repo.path, 'albumin', 'write.lock')
+        script = (
+            'import sys, fcntl\n'
+            'with open(sys.argv[1], "w") as file:\n'
+            '    try:\n'
+            '        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)\n'
+            '    except OSError:\n'
+            '        sys.exit(1)\n'
+        )
+
+        def locked():
+            return subprocess.call([sys.executable, '-c', script, path]) == 1
+
+        with repo.write_lock():
+            assert locked()
+            with repo.write_lock():
+                assert locked()
+            assert locked()
+        assert not locked()
+        assert repo._lock_file is None
+
+
+class TestAlbuminMetadata(TestCase):
+    def metadata(self, fields):
+        reads = []
+
+        def getitem(metadata, meta_key):
+            reads.append(meta_key)
+            return fields[meta_key]
+
+        def setitem(metadata, meta_key, value):
+            fields[meta_key] = value
+
+        def delitem(metadata, meta_key):
+            del fields[meta_key]
+
+        patches = [
+            mock.patch.object(GitAnnexMetadata, '__getitem__', getitem),
+            mock.patch.object(GitAnnexMetadata, '__setitem__', setitem),
+            mock.patch.object(GitAnnexMetadata, '__delitem__', delitem),
+            mock.patch.object(GitAnnexMetadata, 'get', Mapping.get),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        metadata = AlbuminMetadata.__new__(AlbuminMetadata)
+        metadata._parsed = {}
+        return metadata, reads
+
+    def test_memo(self):
+        metadata, reads = self.metadata({
+            'datetime': ['2014-07-15@09-30-00'],
+            'datetime-method': ['ExifTool/EXIF/DateTimeOriginal'],
+            'timezone': ['Europe/Istanbul'],
+        })
+        first = metadata.imdate
+        second = metadata.imdate
+        assert first.datetime == second.datetime
+        assert str(first.datetime.tzinfo) == 'Europe/Istanbul'
+        assert sorted(reads) == ['datetime', 'datetime-method', 'timezone']
+
+    def test_invalidate(self):
+        metadata, reads = self.metadata({
+            'datetime': ['2014-07-15@09-30-00'],
+            'datetime-method': ['Filename/Delimited'],
+        })
+        assert metadata.imdate.datetime.hour == 9
+
+        imdate = ImageDate(
+            'ExifTool/EXIF/DateTimeOriginal',
+            metadata['datetime'].replace(hour=10),
+        )
+        metadata.imdate = imdate
+        assert metadata.imdate.method == imdate.method
+        assert metadata.imdate.datetime.hour == 10
+
+        del metadata['datetime-method']
+        assert metadata.imdate is None
+        assert metadata.get('datetime-method') is None
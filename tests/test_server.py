@@ -0,0 +1,94 @@
+# Albumin Server Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import signal
+import subprocess
+import multiprocessing
+from unittest import TestCase
+
+from tests.utils import GitRepo
+from tests.utils import with_folder
+
+from albumin.server import find_git_dir
+from albumin.server import socket_path
+from albumin.server import serve
+
+
+def run_echo(argv, repo=None):
+    print('out', *argv[1:])
+    sys.stdout.flush()
+    subprocess.check_call(['sh', '-c', 'echo child; echo error >&2'])
+    print('done', file=sys.stderr)
+    return 3
+
+
+def forward_check(cwd):
+    albumin_path = os.path.dirname(os.path.dirname(__file__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [albumin_path, env.get('PYTHONPATH')])
+    )
+    script = (
+        'import sys\n'
+        'from albumin.server import forward\n'
+        'sys.exit(forward(["albumin", "check"], {}))\n'
+    )
+    return subprocess.run(
+        [sys.executable, '-c', script], cwd=cwd, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+
+class TestServer(TestCase):
+    @with_folder()
+    def test_find_git_dir(self, temp_folder):
+        repo = GitRepo(os.path.join(temp_folder, 'repo'))
+        subdir = os.path.join(repo.workdir, 'a', 'b')
+        os.makedirs(subdir)
+        git_dir = os.path.join(temp_folder, 'repo', '.git')
+        assert find_git_dir(subdir) == git_dir
+
+        worktree = os.path.join(temp_folder, 'worktree')
+        os.mkdir(worktree)
+        with open(os.path.join(worktree, '.git'), 'w') as file:
+            print('gitdir: {}'.format(git_dir), file=file)
+        assert find_git_dir(worktree) == git_dir
+
+    @with_folder()
+    def test_forward(self, temp_folder):
+        repo = GitRepo(temp_folder)
+        path = socket_path(repo.path)
+        assert forward_check(temp_folder).returncode == 0
+
+        server = multiprocessing.Process(target=serve, args=(repo, run_echo))
+        server.start()
+        try:
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+
+            result = forward_check(temp_folder)
+            assert result.returncode == 3
+            assert result.stdout.decode() == 'out check\nchild\n'
+            assert result.stderr.decode() == 'error\ndone\n'
+        finally:
+            os.kill(server.pid, signal.SIGINT)
+            server.join()
+        assert not os.path.exists(path)
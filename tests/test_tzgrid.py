@@ -0,0 +1,50 @@
+# Albumin Timezone Grid Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+from unittest import TestCase
+
+from albumin.tzgrid import TimezoneGrid
+from albumin.tzgrid import build_grid
+
+
+class TestTimezoneGrid(TestCase):
+    geojson = {'features': [
+        {
+            'properties': {'tzid': 'Europe/Istanbul'},
+            'geometry': {'type': 'Polygon', 'coordinates': [
+                [[26, 36], [45, 36], [45, 42], [26, 42], [26, 36]],
+            ]},
+        },
+        {
+            'properties': {'tzid': 'Asia/Kolkata'},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': [
+                [[[68, 8], [97, 8], [97, 35], [68, 35], [68, 8]]],
+            ]},
+        },
+    ]}
+
+    def test_lookup(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'timezones.grid')
+            build_grid(self.geojson, path, resolution=4)
+
+            grid = TimezoneGrid(path)
+            assert grid.lookup(41.0, 29.0) == 'Europe/Istanbul'
+            assert grid.lookup(20.0, 77.0) == 'Asia/Kolkata'
+            assert grid.lookup(0.0, 0.0) is None
+            grid.close()
@@ -15,11 +15,15 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from unittest import TestCase
+from unittest import mock
 from tests.utils import with_folder
 import tempfile
+import errno
 import os
 
 from albumin.utils import make_tar
+from albumin.utils import in_shard
+from albumin.utils import place_file
 
 
 class TestUtils(TestCase):
@@ -34,3 +38,64 @@ class TestUtils(TestCase):
             tmp_name = tar_file.name
         make_tar(tmp_name, temp_folder)
         os.remove(tmp_name)
+
+    def test_in_shard(self):
+        paths = ['{}/IMG_{:04}.jpg'.format(i % 7, i) for i in range(1000)]
+        shards = [
+            [p for p in paths if in_shard(p, (i, 4))] for i in range(4)
+        ]
+        assert sorted(sum(shards, [])) == sorted(paths)
+        assert all(150 < len(shard) < 350 for shard in shards)
+
+    def write(self, path, data):
+        with open(path, 'wb') as file:
+            file.write(data)
+        os.utime(path, (1400000000, 1400000000))
+
+    def read(self, path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    @with_folder()
+    def test_place_file(self, temp_folder):
+        src = os.path.join(temp_folder, 'src.jpg')
+        dst = os.path.join(temp_folder, 'a', 'dst.jpg')
+
+        self.write(src, b'x' * 1024)
+        assert place_file(src, dst) == 'rename'
+        assert not os.path.exists(src)
+        assert self.read(dst) == b'x' * 1024
+
+        self.write(src, b'y' * 1024)
+        assert place_file(src, dst, keep=True) != 'rename'
+        assert self.read(src) == self.read(dst) == b'y' * 1024
+        assert os.stat(dst).st_mtime == 1400000000
+
+    @with_folder()
+    def test_place_file_fallback(self, temp_folder):
+        src = os.path.join(temp_folder, 'src.jpg')
+        dst = os.path.join(temp_folder, 'dst.jpg')
+        cross_device = OSError(errno.EXDEV, 'Cross-device link')
+
+        self.write(src, b'x' * 1024)
+        with mock.patch('os.rename', side_effect=cross_device):
+            assert place_file(src, dst) in \
+                ('reflink', 'copy_file_range', 'copy')
+        assert not os.path.exists(src)
+        assert self.read(dst) == b'x' * 1024
+        assert os.stat(dst).st_mtime == 1400000000
+
+        self.write(src, b'y' * 1024)
+        with mock.patch('os.rename', side_effect=cross_device), \
+                mock.patch('fcntl.ioctl', side_effect=OSError), \
+                mock.patch('os.copy_file_range', side_effect=OSError):
+            assert place_file(src, dst) == 'copy'
+        assert not os.path.exists(src)
+        assert self.read(dst) == b'y' * 1024
+
+        self.write(src, b'z' * 1024)
+        denied = OSError(errno.EACCES, 'Permission denied')
+        with mock.patch('os.rename', side_effect=denied):
+            with self.assertRaises(OSError):
+                place_file(src, dst)
+        assert self.read(src) == b'z' * 1024
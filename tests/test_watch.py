@@ -0,0 +1,83 @@
+# Albumin Inbox Watching Tests
+# Copyright (C) 2016 Alper Nebi Yasak
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+from unittest import TestCase
+
+from albumin.watch import Inbox
+
+
+class TestInbox(TestCase):
+    def test_inotify(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            old = os.path.join(temp_dir, 'old.jpg')
+            with open(old, 'wb') as file:
+                file.write(b'z' * 1024)
+
+            with Inbox(temp_dir, settle=0.2) as inbox:
+                assert inbox.wait(2) == [old]
+
+                os.mkdir(os.path.join(temp_dir, 'DCIM'))
+                assert inbox.wait(0.1) == []
+                partial = os.path.join(temp_dir, 'DCIM', 'partial.jpg')
+                done = os.path.join(temp_dir, 'DCIM', 'done.jpg')
+
+                writer = open(partial, 'wb')
+                writer.write(b'x' * 1024)
+                writer.flush()
+                with open(done + '.tmp', 'wb') as file:
+                    file.write(b'y' * 1024)
+                os.rename(done + '.tmp', done)
+
+                assert inbox.wait(1) == [done]
+                assert inbox.wait(0.5) == []
+
+                writer.write(b'x' * 1024)
+                writer.close()
+                assert inbox.wait(2) == [partial]
+                assert inbox.wait(0.5) == []
+
+    def test_links(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            inbox_dir = os.path.join(temp_dir, 'inbox')
+            os.mkdir(inbox_dir)
+            target = os.path.join(temp_dir, 'a.jpg')
+            with open(target, 'wb') as file:
+                file.write(b'x' * 1024)
+
+            with Inbox(inbox_dir, settle=0.2) as inbox:
+                symlink = os.path.join(inbox_dir, 'symlink.jpg')
+                hardlink = os.path.join(inbox_dir, 'hardlink.jpg')
+                os.symlink(target, symlink)
+                os.link(target, hardlink)
+
+                assert sorted(inbox.wait(2) + inbox.wait(0.5)) == \
+                    [hardlink, symlink]
+
+    def test_scan(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with Inbox(temp_dir, settle=0.2) as inbox:
+                inbox.close()
+                assert inbox.wait(0.1) == []
+
+                os.mkdir(os.path.join(temp_dir, 'DCIM'))
+                path = os.path.join(temp_dir, 'DCIM', 'a.jpg')
+                with open(path, 'wb') as file:
+                    file.write(b'x' * 1024)
+
+                assert inbox.wait(2) == [path]
+                assert inbox.wait(0.5) == []
@@ -14,10 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import tempfile
 import functools
 import tarfile
 import shutil
+from types import SimpleNamespace
+
+import pygit2
 
 from albumin.repo import AlbuminRepo
 
@@ -54,3 +58,47 @@ def with_repo(tar_path=None, annex=False, param='repo'):
                     repo.annex._annex('uninit')
         return wrapper
     return decorator
+
+
+def fake_repo(path):
+    """
+    Stands in for an AlbuminRepo where only its paths are used.
+    """
+    return SimpleNamespace(
+        path=path, abs_path=lambda name: os.path.join(path, name),
+    )
+
+
+class RecordingAnnex:
+    def __init__(self):
+        self.calls = []
+
+    def _annex(self, *args):
+        self.calls.append(args)
+
+
+class GitRepo(AlbuminRepo):
+    """
+    An AlbuminRepo over a plain git repo, which records git-annex calls
+    instead of making them.
+    """
+
+    def __init__(self, path):
+        pygit2.init_repository(path)
+        pygit2.Repository.__init__(self, path)
+        self.annex = RecordingAnnex()
+        self._session_timezone = None
+        self._key_cache = None
+        self._lock_file = None
+        self._lock_depth = 0
+
+
+def with_git_repo(param='repo'):
+    def decorator(func):
+        @functools.wraps(func)
+        @with_folder(param='repo_path')
+        def wrapper(*args, **kwargs):
+            kwargs[param] = GitRepo(kwargs.pop('repo_path'))
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator